@@ -0,0 +1,10 @@
+# coding: utf-8
+
+""" Benchmarks of the build and query paths of OmenMachine on synthetic cards.
+
+    python -m benchmarks --cards 20000 --modes dense,topk,query --output results.json
+    python -m benchmarks --compare old.json new.json
+"""
+
+from .synthetic import generateCards, writeBulkFile
+from .measure import measure, latencies, summarize
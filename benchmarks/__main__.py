@@ -0,0 +1,175 @@
+# coding: utf-8
+
+import os
+import json
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+import omenmachine
+from benchmarks.synthetic import writeBulkFile, allFormats
+from benchmarks.measure import measure, latencies, summarize
+from benchmarks.import_time import coldStart, queryStatements
+
+
+# Filter combinations of typical queries, e.g. from the GUI
+filterMixes = {
+    'none': {},
+    'cmc': {'cmcFilter': '<=3'},
+    'color': {'colorFilter': ['G']},
+    'commander': {'commanderFilter': ['U', 'R']},
+    'format': {'legalityFilter': 'modern'},
+    'strict': {'legalityFilter': ['pauper'], 'rarityFilter': ['common'],
+               'typeFilter': ['Instant', 'Sorcery'], 'cmcFilter': '<=2'},
+    }
+
+
+def _gitRevision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+            ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(args):
+    results = {
+        'revision': _gitRevision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'config': vars(args),
+        'stages': [],
+        'queries': [],
+        'coldStart': [],
+        }
+
+    def record(stage, mode, measurement, **extra):
+        results['stages'].append(dict(stage=stage, mode=mode, **measurement, **extra))
+        peak = '' if measurement['peakMB'] is None else ', peak {0:.1f} MB'.format(measurement['peakMB'])
+        print('{0:<16} {1:<10} {2:8.2f} s{3}'.format(stage, mode or '', measurement['seconds'], peak))
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmpDir:
+        bulkFile = os.path.join(tmpDir, 'bulk.json')
+        uniqueFile = os.path.join(tmpDir, 'unique.json')
+        nObjects = writeBulkFile(bulkFile, nCards=args.cards, doubleFacedRatio=args.double_faced,
+                                 printings=args.printings, formats=allFormats[:args.formats], seed=args.seed)
+        print('Generated {0} card objects with {1} unique names'.format(nObjects, args.cards))
+
+        for stream in (False, True):
+            _, measurement = measure(omenmachine.prepJsonFile, bulkFile, uniqueFile, chatty=False, stream=stream,
+                                     traceMemory=args.memory)
+            record('prepJsonFile', 'stream' if stream else 'load', measurement)
+
+        # The first instance creates the metadata cache, the second one loads it
+        for stage in ('init', 'init (cached)'):
+            om, measurement = measure(omenmachine.OmenMachine, uniqueFile, os.path.join(tmpDir, 'sim'), chatty=False,
+                                      traceMemory=args.memory)
+            record(stage, None, measurement)
+
+        rng = random.Random(args.seed)
+        queryNames = [rng.choice(om.uniqueNames) for _ in range(args.queries)]
+
+        for mode in args.modes:
+            simFile = os.path.join(tmpDir, 'sim-{0}'.format(mode))
+            om = omenmachine.OmenMachine(uniqueFile, simFile, chatty=False)
+            _, measurement = measure(om.runML, mode=mode, blockSize=args.block_size, nJobs=args.jobs,
+                                     traceMemory=args.memory)
+            record('runML', mode, measurement)
+
+            om = omenmachine.OmenMachine(uniqueFile, simFile, chatty=False)
+            _, measurement = measure(om.loadML, traceMemory=args.memory)
+            record('loadML', mode, measurement)
+
+            for mixName, filters in filterMixes.items():
+                times = latencies(om.getSimilarCards, [((name,), filters) for name in queryNames])
+                summary = summarize(times)
+                results['queries'].append(dict(mode=mode, filters=mixName, **summary))
+                print('{0:<16} {1:<10} {2:<10} p50 {p50:7.2f} ms  p90 {p90:7.2f} ms  p99 {p99:7.2f} ms'.format(
+                    'getSimilarCards', mode, mixName, **summary))
+
+            _, measurement = measure(om.getSimilarCardsBatch, queryNames, traceMemory=args.memory)
+            record('batch', mode, measurement, cardsPerSecond=len(queryNames)/max(measurement['seconds'], 1e-9))
+
+            # Fresh processes from the import of the package to the first query
+            if args.cold_start > 0:
+                for stage, statement in queryStatements(uniqueFile, simFile).items():
+                    summary = coldStart(statement, repeat=args.cold_start)
+                    results['coldStart'].append(dict(mode=mode, stage=stage, **summary))
+                    print('{0:<16} {1:<10} {2:<10} p50 {3:7.1f} ms  imports {4}'.format(
+                        'coldStart', mode, stage, summary['p50'], ', '.join(summary['modules'])))
+
+    return results
+
+
+def compareResults(oldFile, newFile):
+    """ Print the ratio new/old of the times of two result files. Ratios above 1 are slower """
+    with open(oldFile) as openFile:
+        old = json.load(openFile)
+    with open(newFile) as openFile:
+        new = json.load(openFile)
+    print('{0} -> {1}'.format(old.get('revision'), new.get('revision')))
+
+    oldStages = {(stage['stage'], stage['mode']): stage for stage in old['stages']}
+    for stage in new['stages']:
+        before = oldStages.get((stage['stage'], stage['mode']))
+        if before is not None:
+            print('{0:<16} {1:<10} {2:8.2f} s -> {3:8.2f} s  x{4:.2f}'.format(
+                stage['stage'], stage['mode'] or '', before['seconds'], stage['seconds'],
+                stage['seconds']/max(before['seconds'], 1e-9)))
+
+    oldQueries = {(query['mode'], query['filters']): query for query in old['queries']}
+    for query in new['queries']:
+        before = oldQueries.get((query['mode'], query['filters']))
+        if before is not None:
+            print('{0:<16} {1:<10} {2:<10} p50 {3:7.2f} -> {4:7.2f} ms  x{5:.2f}'.format(
+                'getSimilarCards', query['mode'], query['filters'], before['p50'], query['p50'],
+                query['p50']/max(before['p50'], 1e-9)))
+
+    oldStarts = {(start['mode'], start['stage']): start for start in old.get('coldStart', [])}
+    for start in new.get('coldStart', []):
+        before = oldStarts.get((start['mode'], start['stage']))
+        if before is not None:
+            print('{0:<16} {1:<10} {2:<10} p50 {3:7.1f} -> {4:7.1f} ms  x{5:.2f}'.format(
+                'coldStart', start['mode'], start['stage'], before['p50'], start['p50'],
+                start['p50']/max(before['p50'], 1e-9)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks of the build and query paths.')
+    parser.add_argument('--cards', type=int, default=20000, help='Number of unique card names')
+    parser.add_argument('--double-faced', type=float, default=0.05, help='Fraction of double-faced cards')
+    parser.add_argument('--printings', type=float, default=1.5, help='Mean number of printings per card')
+    parser.add_argument('--formats', type=int, default=len(allFormats), help='Number of legality columns')
+    parser.add_argument('--modes', type=lambda value: value.split(','), default=['dense', 'topk', 'query', 'memmap'],
+                        help='Comma-separated modes of runML')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries per filter mix')
+    parser.add_argument('--block-size', type=int, default=1000)
+    parser.add_argument('--jobs', type=int, default=1, help='nJobs of runML')
+    parser.add_argument('--cold-start', type=int, default=3,
+                        help='Number of fresh processes that time the import, loadML and the first query. 0 disables it')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Do not trace the peak memory, which slows down pure Python code')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help='Directory of the temporary files')
+    parser.add_argument('--output', default=None, help='Json file with the results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compareResults(*args.compare)
+        return
+
+    results = runBenchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=1)
+
+
+if __name__ == '__main__':
+    main()
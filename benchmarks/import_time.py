@@ -0,0 +1,73 @@
+# coding: utf-8
+
+""" Cold start of the query path: every statement runs in a fresh interpreter.
+
+    python -m benchmarks.import_time [unique json file] [similarity file]
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+from .measure import summarize
+
+
+# Libraries whose import dominates the start of a process
+heavyModules = ['numpy', 'scipy', 'pandas', 'sklearn', 'joblib']
+
+_script = '''
+import sys, time, json
+startTime = time.perf_counter()
+{statement}
+seconds = time.perf_counter()-startTime
+print(json.dumps({{'seconds': seconds, 'modules': [name for name in {modules!r} if name in sys.modules]}}))
+'''
+
+
+def coldStart(statement, repeat=5, cwd=None):
+    """ Time a statement in fresh Python processes, so no module is imported yet
+
+    :param statement: Python code, e.g. "import omenmachine"
+    :param repeat: Number of processes
+    :param cwd: Working directory of the processes, by default the repository
+
+    Returns (dict) with the summarized times in milliseconds and the heavy modules that were imported
+    """
+    if cwd is None:
+        cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _script.format(statement=statement, modules=heavyModules)], cwd=cwd
+            )
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        times.append(1000*result['seconds'])
+    return dict(summarize(times), modules=result['modules'])
+
+
+def queryStatements(jsonUniqueFile, simDfFile):
+    """ Statements of the query path from the package import to the first query """
+    setup = 'import omenmachine\nom = omenmachine.OmenMachine({0!r}, {1!r}, chatty=False)'.format(
+        os.path.abspath(jsonUniqueFile), os.path.abspath(simDfFile))
+    return {
+        'import': 'import omenmachine',
+        'init': setup,
+        'loadML': setup+'\nom.loadML()',
+        'firstQuery': setup+'\nom.loadML()\nom.getSimilarCards(om.uniqueNames[0])',
+        }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    statements = {'import': 'import omenmachine'}
+    if len(argv) >= 2:
+        statements = queryStatements(argv[0], argv[1])
+
+    for stage, statement in statements.items():
+        result = coldStart(statement)
+        print('{0:<12} p50 {1:8.1f} ms  imports {2}'.format(stage, result['p50'], ', '.join(result['modules'])))
+
+
+if __name__ == '__main__':
+    main()
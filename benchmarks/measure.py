@@ -0,0 +1,58 @@
+# coding: utf-8
+
+""" Timing and memory measurements of the benchmark stages """
+
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def measure(function, *args, traceMemory=True, **kwargs):
+    """ Call a function and measure its wall time and peak memory.
+    The memory is traced with tracemalloc, which also sees NumPy arrays, and is the
+    peak of the memory that was allocated during the call on top of the memory before.
+    Tracing slows down pure Python code, so traceMemory=False gives more accurate times.
+
+    Returns (object), (dict): the result of the call and {"seconds": ..., "peakMB": ...}
+    """
+    if not traceMemory:
+        startTime = time.perf_counter()
+        result = function(*args, **kwargs)
+        return result, {'seconds': time.perf_counter()-startTime, 'peakMB': None}
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    startTime = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter()-startTime
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {'seconds': seconds, 'peakMB': (peak-baseline)/2**20}
+
+
+def latencies(function, argumentList):
+    """ Wall time of every call in milliseconds
+
+    :param function: Function that is called once per entry of argumentList
+    :param argumentList: List of (args, kwargs) tuples
+    """
+    times = np.empty(len(argumentList))
+    for ii, (args, kwargs) in enumerate(argumentList):
+        startTime = time.perf_counter()
+        function(*args, **kwargs)
+        times[ii] = 1000*(time.perf_counter()-startTime)
+    return times
+
+
+def summarize(times, percentiles=(50, 90, 99)):
+    """ Mean and percentiles of latencies as a dictionary, e.g. {"mean": ..., "p50": ...} """
+    if len(times) == 0:
+        return {}
+    summary = {'n': int(len(times)), 'mean': float(np.mean(times))}
+    for percentile, value in zip(percentiles, np.percentile(times, percentiles)):
+        summary['p{0}'.format(percentile)] = float(value)
+    return summary
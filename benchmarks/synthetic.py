@@ -0,0 +1,127 @@
+# coding: utf-8
+
+""" Generator of synthetic, Scryfall-like card objects for benchmarks.
+The cards have the fields that OmenMachine uses, including double-faced cards with
+"card_faces", several printings per name, tokens and a configurable set of formats.
+"""
+
+import json
+import random
+
+
+allFormats = ['standard', 'future', 'historic', 'gladiator', 'pioneer', 'explorer', 'modern',
+              'legacy', 'pauper', 'vintage', 'penny', 'commander', 'brawl', 'historicbrawl',
+              'alchemy', 'paupercommander', 'duel', 'oldschool', 'premodern']
+
+cardTypes = ['Creature — Elf Warrior', 'Creature — Human Wizard', 'Creature — Zombie', 'Creature — Dragon',
+             'Artifact Creature — Golem', 'Legendary Creature — Elf Druid', 'Instant', 'Sorcery',
+             'Artifact', 'Artifact — Equipment', 'Enchantment', 'Enchantment — Aura', 'Land',
+             'Legendary Planeswalker — Jace', 'Tribal Instant — Elf', 'Plane — Dominaria']
+
+rarities = ['common', 'common', 'common', 'uncommon', 'uncommon', 'rare', 'mythic']
+
+phrases = ['Flying', 'Trample', 'Haste', 'Vigilance', 'Deathtouch', 'Lifelink', 'First strike',
+           'When {name} enters the battlefield, draw a card.', 'Target creature gets +{n}/+{n} until end of turn.',
+           'Destroy target artifact or enchantment.', 'Counter target spell.', '{name} deals {n} damage to any target.',
+           'Return target creature card from your graveyard to your hand.', 'Each opponent loses {n} life.',
+           'You gain {n} life.', 'Search your library for a basic land card, put it onto the battlefield tapped, then shuffle.',
+           'Create a {n}/{n} green Elf Warrior creature token.', 'Exile target nonland permanent.',
+           'Scry {n}.', 'Discard a card, then draw a card.', 'Sacrifice a creature: Add {{B}}.',
+           '{{T}}: Add one mana of any color.', 'Cycling {{{n}}} ({{{n}}}, Discard this card: Draw a card.)',
+           'Equipped creature gets +{n}/+0.', 'Equip {{{n}}}', 'Proliferate.', 'Kicker {{{n}}}{{R}}']
+
+colors = 'WUBRG'
+
+
+def _manaCost(rng, cardColors):
+    generic = rng.randint(0, 5)
+    return ('{{{0}}}'.format(generic) if generic or not cardColors else '')+''.join(
+        '{{{0}}}'.format(color) for color in cardColors for _ in range(rng.randint(1, 2)))
+
+
+def _oracleText(rng, name):
+    return '\n'.join(rng.choice(phrases).format(name=name, n=rng.randint(1, 4)) for _ in range(rng.randint(1, 5)))
+
+
+def _face(rng, name, typeLine, cardColors):
+    face = {
+        'object': 'card_face',
+        'name': name,
+        'mana_cost': _manaCost(rng, cardColors),
+        'type_line': typeLine,
+        'oracle_text': _oracleText(rng, name),
+        'colors': cardColors,
+        'image_uris': {'large': 'https://img.example/large/{0}.jpg'.format(name.replace(' ', '-').lower())},
+        }
+    if 'Creature' in typeLine:
+        face['power'] = str(rng.randint(0, 7))
+        face['toughness'] = str(rng.randint(1, 7))
+    return face
+
+
+def generateCards(nCards=20000, doubleFacedRatio=0.05, printings=1.5, tokenRatio=0.02, formats=None, seed=0):
+    """ Generate a list of Scryfall-like card objects
+
+    :param nCards: Number of unique card names
+    :param doubleFacedRatio: Fraction of the cards with two faces in "card_faces"
+    :param printings: Mean number of card objects per name, e.g. reprints in several sets
+    :param tokenRatio: Fraction of additional token objects, which prepJsonFile filters out
+    :param formats: List of format names in "legalities". None uses all formats
+    :param seed: Seed of the random generator, the same seed generates the same cards
+    """
+    rng = random.Random(seed)
+    formats = allFormats if formats is None else formats
+
+    cards = []
+    for cardId in range(nCards+int(tokenRatio*nCards)):
+        isToken = cardId >= nCards
+        cardColors = sorted(rng.sample(colors, rng.choice([0, 1, 1, 1, 2, 2, 3])), key=colors.index)
+        typeLine = 'Token Creature — Goblin' if isToken else rng.choice(cardTypes)
+        name = 'Synthetic Card {0}'.format(cardId)
+
+        card = {
+            'object': 'card',
+            'name': name,
+            'lang': 'en',
+            'cmc': 0.,
+            'type_line': typeLine,
+            'color_identity': cardColors,
+            'rarity': rng.choice(rarities),
+            'legalities': {formatName: rng.choice(['legal', 'legal', 'not_legal', 'banned']) for formatName in formats},
+            }
+
+        if not isToken and rng.random() < doubleFacedRatio:
+            backName = 'Synthetic Back {0}'.format(cardId)
+            card['name'] = '{0} // {1}'.format(name, backName)
+            card['layout'] = 'transform'
+            card['card_faces'] = [_face(rng, name, typeLine, cardColors), _face(rng, backName, typeLine, cardColors)]
+            card['card_faces'][1]['mana_cost'] = ''
+            card['cmc'] = float(sum(character.isdigit() and int(character) or character in colors
+                                    for character in card['card_faces'][0]['mana_cost']))
+        else:
+            card['layout'] = 'normal'
+            card.update({key: value for key, value in _face(rng, name, typeLine, cardColors).items() if key != 'object'})
+            card['cmc'] = float(sum(character.isdigit() and int(character) or character in colors
+                                    for character in card['mana_cost']))
+
+        # Reprints in other sets share the name and the rules text
+        for printing in range(max(1, int(rng.expovariate(1/printings)+0.5))):
+            cards.append(dict(card, id='{0:08x}-{1:04x}'.format(cardId, printing), set='s{0:02d}'.format(printing),
+                              scryfall_uri='https://scryfall.example/card/{0}/{1}'.format(printing, cardId)))
+
+    rng.shuffle(cards)
+    return cards
+
+
+def writeBulkFile(bulkFile, **parameters):
+    """ Write synthetic cards as a Scryfall bulk data json file
+
+    :param bulkFile: Path of the json file
+    :param parameters: Parameters of generateCards
+
+    Returns (int) number of card objects
+    """
+    cards = generateCards(**parameters)
+    with open(bulkFile, 'w') as outfile:
+        json.dump(cards, outfile)
+    return len(cards)
@@ -0,0 +1,58 @@
+# coding: utf-8
+
+""" Recall and latency of the approximate nearest-neighbour index ("ann" mode)
+against the exact similarity ("query" mode) on the unique cards.
+
+Usage: python benchmark_ann.py [k] [number of queried cards]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+sys.path.append('../')
+
+import omenmachine
+from omenmachine.ann_index import exactRecall
+
+
+def queryLatency(index, rowIds, topN):
+    """ Mean time of a query in milliseconds """
+    startTime = time.perf_counter()
+    for rowId in rowIds:
+        index.query(rowId, topN)
+    return 1000*(time.perf_counter()-startTime)/len(rowIds)
+
+
+if __name__ == '__main__':
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    nQueries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    jsonUniqueFile = 'default-cards-unique.json'
+    if not os.path.isfile(jsonUniqueFile):
+        omenmachine.prepJsonFile('default-cards-20200615170431.json', jsonUniqueFile, chatty=True)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        exact = omenmachine.OmenMachine(jsonUniqueFile, os.path.join(tmpDir, 'exact'), chatty=False)
+        exact.runML(mode='query')
+
+        om = omenmachine.OmenMachine(jsonUniqueFile, os.path.join(tmpDir, 'ann'), chatty=False)
+        startTime = time.time()
+        om.runML(mode='ann')
+        print('Built {0} lists for {1} cards in {2:.1f} s'.format(
+            om.similarityIndex.nLists, len(om.similarityIndex), time.time()-startTime))
+
+    rng = np.random.default_rng(0)
+    rowIds = rng.choice(len(om.uniqueNames), size=min(nQueries, len(om.uniqueNames)), replace=False)
+
+    print('{0:>7} {1:>9} {2:>11}'.format('nProbe', 'recall@{0}'.format(k), 'query [ms]'))
+    print('{0:>7} {1:>9.3f} {2:>11.2f}'.format('exact', 1., queryLatency(exact.similarityIndex, rowIds, k)))
+    for nProbe in (1, 2, 4, 8, 16, 32, 64):
+        if nProbe > om.similarityIndex.nLists:
+            break
+        om.similarityIndex.nProbe = nProbe
+        print('{0:>7} {1:>9.3f} {2:>11.2f}'.format(
+            nProbe, exactRecall(om.similarityIndex, exact.similarityIndex, rowIds, k),
+            queryLatency(om.similarityIndex, rowIds, k)))
@@ -0,0 +1,97 @@
+# coding: utf-8
+
+""" Benchmark of the weighting and the data type of the stored similarity scores.
+For every configuration, the size of the stored similarity information, the query time
+and the recall@k against the original float64 count similarity are printed.
+
+Usage: python benchmark_scores.py [k] [number of queried cards]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+sys.path.append('../')
+
+import omenmachine
+from omenmachine.similarity_index import MemmapIndex
+
+
+configurations = [
+    dict(mode='dense', weighting='count', scoreDtype='float64'), # reference
+    dict(mode='dense', weighting='count', scoreDtype='float32'),
+    dict(mode='dense', weighting='count', scoreDtype='float16'),
+    dict(mode='memmap', weighting='count', scoreDtype='uint8'),
+    dict(mode='topk', weighting='count', scoreDtype='float16'),
+    dict(mode='embedding', weighting='count', nComponents=128),
+    dict(mode='embedding', weighting='count', nComponents=256),
+    dict(mode='dense', weighting='tfidf', scoreDtype='float32'),
+    dict(mode='dense', weighting='sublinear', scoreDtype='float32'),
+    dict(mode='dense', weighting='bm25', scoreDtype='float32'),
+    ]
+
+
+def storedBytes(om):
+    """ Size of the similarity information of a model in memory or on disk """
+    if om.similarCardsDf is not None:
+        return om.similarCardsDf.values.nbytes
+    index = om.similarityIndex
+    if isinstance(index, MemmapIndex):
+        return os.path.getsize(index.arrayFile(index.indexFile))
+    if hasattr(index, 'neighbours'):
+        return index.neighbours.nbytes+index.scores.nbytes
+    if hasattr(index, 'vectors'):
+        return index.vectors.nbytes
+    return index.featureMatrix.data.nbytes+index.featureMatrix.indices.nbytes+index.featureMatrix.indptr.nbytes
+
+
+def neighbourSets(om, names, k):
+    """ Most similar cards of every queried card and the mean query time in milliseconds """
+    startTime = time.perf_counter()
+    result = om.getSimilarCardsBatch(names, queryNumber=k)
+    queryTime = 1000*(time.perf_counter()-startTime)/len(names)
+    return {name: set(group['name']) for name, group in result.groupby('magic_card')}, queryTime
+
+
+def recallAtK(reference, neighbours, k):
+    return np.mean([len(reference[name] & neighbours.get(name, set()))/k for name in reference])
+
+
+if __name__ == '__main__':
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    nQueries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    jsonUniqueFile = 'default-cards-unique.json'
+    if not os.path.isfile(jsonUniqueFile):
+        omenmachine.prepJsonFile('default-cards-20200615170431.json', jsonUniqueFile, chatty=True)
+
+    reference = None
+    with tempfile.TemporaryDirectory() as tmpDir:
+        print('{0:<10} {1:<10} {2:<8} {3:>10} {4:>8} {5:>10} {6:>11} {7:>9}'.format(
+            'mode', 'weighting', 'dtype', 'MB', 'saved', 'build [s]', 'query [ms]', 'recall@{0}'.format(k)))
+
+        for ii, configuration in enumerate(configurations):
+            om = omenmachine.OmenMachine(jsonUniqueFile, os.path.join(tmpDir, 'sim{0}'.format(ii)), chatty=False)
+
+            startTime = time.time()
+            om.runML(**configuration)
+            buildTime = time.time()-startTime
+
+            if reference is None:
+                rng = np.random.default_rng(0)
+                names = list(rng.choice(om.uniqueNames, size=min(nQueries, len(om.uniqueNames)), replace=False))
+                reference, _ = neighbourSets(om, names, k)
+                referenceBytes = storedBytes(om)
+
+            nBytes = storedBytes(om)
+            neighbours, queryTime = neighbourSets(om, names, k)
+            dtype = configuration.get('scoreDtype', '{0} dim'.format(configuration.get('nComponents', '')))
+            print('{0:<10} {1:<10} {2:<8} {3:>10.1f} {4:>7.0%} {5:>10.1f} {6:>11.3f} {7:>9.3f}'.format(
+                configuration['mode'], configuration['weighting'], dtype,
+                nBytes/2**20, 1-nBytes/referenceBytes, buildTime, queryTime,
+                recallAtK(reference, neighbours, k)))
+
+            # Release the memory-mapped file before the directory is removed
+            del om
@@ -3,6 +3,7 @@
 # http://code.activestate.com/recipes/580770-combobox-autocomplete/
 
 import re
+from bisect import bisect_left
 
 try:
     from Tkinter import StringVar, Entry, Frame, Listbox, Scrollbar
@@ -22,6 +23,93 @@ def autoscroll(sbar, first, last):
     sbar.set(first, last)
 
 
+class Prefix_Completer(object):
+    """Autocomplete backend that finds the items starting with the entry data.
+
+    The items are sorted once, so every lookup is a binary search. When the user
+    extends the previous entry data, only the previous range of items is searched.
+    The number of returned items is capped by max_results.
+    """
+
+    def __init__(self, list_of_items, ignorecase=True, max_results=50):
+        self._ignorecase = ignorecase
+        self.max_results = max_results
+
+        keyed_items = sorted((self._key(item), item) for item in list_of_items)
+        self._keys = [key for key, item in keyed_items]
+        self._items = [item for key, item in keyed_items]
+
+        # Entry data and range of matching items of the previous lookup
+        self._last = None
+
+    def _key(self, text):
+        return text.lower() if self._ignorecase else text
+
+    def _range(self, entry_data):
+        lo, hi = 0, len(self._keys)
+        if self._last is not None and entry_data.startswith(self._last[0]):
+            # Reuse the result of the previous keystroke
+            lo, hi = self._last[1], self._last[2]
+
+        lo = bisect_left(self._keys, entry_data, lo, hi)
+        # All keys that start with entry_data are smaller than entry_data followed by the largest character
+        hi = bisect_left(self._keys, entry_data+u'\U0010ffff', lo, hi)
+        self._last = (entry_data, lo, hi)
+        return lo, hi
+
+    def __call__(self, entry_data):
+        lo, hi = self._range(self._key(entry_data))
+        return self._items[lo:min(hi, lo+self.max_results)]
+
+
+class Substring_Completer(object):
+    """Autocomplete backend that finds the items containing the entry data.
+
+    An index of the character trigrams of all items restricts the search to the
+    items that contain every trigram of the entry data. When the user extends the
+    previous entry data, only the previous matches are searched.
+    The number of returned items is capped by max_results.
+    """
+
+    def __init__(self, list_of_items, ignorecase=True, max_results=50):
+        self._ignorecase = ignorecase
+        self.max_results = max_results
+
+        self._items = list(list_of_items)
+        self._keys = [self._key(item) for item in self._items]
+
+        self._trigrams = {}
+        for position, key in enumerate(self._keys):
+            for trigram in set(key[start:start+3] for start in range(len(key)-2)):
+                self._trigrams.setdefault(trigram, []).append(position)
+
+        # Entry data and positions of all matching items of the previous lookup
+        self._last = None
+
+    def _key(self, text):
+        return text.lower() if self._ignorecase else text
+
+    def _candidates(self, entry_data):
+        if self._last is not None and entry_data.startswith(self._last[0]):
+            # Reuse the result of the previous keystroke
+            return self._last[1]
+
+        if len(entry_data) < 3:
+            return range(len(self._keys))
+
+        # Items that contain the least common trigram of the entry data
+        postings = []
+        for start in range(len(entry_data)-2):
+            postings.append(self._trigrams.get(entry_data[start:start+3], []))
+        return min(postings, key=len)
+
+    def __call__(self, entry_data):
+        entry_data = self._key(entry_data)
+        positions = [position for position in self._candidates(entry_data) if entry_data in self._keys[position]]
+        self._last = (entry_data, positions)
+        return [self._items[position] for position in positions[:self.max_results]]
+
+
 class Combobox_Autocomplete(Entry, object):
     def __init__(self, master, list_of_items=None, autocomplete_function=None, listbox_width=None, listbox_height=7, ignorecase_match=False, startswith_match=True, vscrollbar=True, hscrollbar=True, **kwargs):
         if hasattr(self, "autocomplete_function"):
@@ -83,6 +171,7 @@ class Combobox_Autocomplete(Entry, object):
         self._trace_id = self._entry_var.trace('w', self._on_change_entry_var)
         
         self._listbox = None
+        self._listbox_values = None
 
         self.bind("<Tab>", self._on_tab)
         self.bind("<Up>", self._previous)
@@ -109,14 +198,15 @@ class Combobox_Autocomplete(Entry, object):
             if values:
                 if self._listbox is None:
                     self._build_listbox(values)
-                else:
+                elif values != self._listbox_values:
+                    # Only refill the listbox when the shown items change
                     self._listbox.delete(0, END)
 
                     height = min(self._listbox_height, len(values))
                     self._listbox.configure(height=height)
 
-                    for item in values:
-                        self._listbox.insert(END, item)
+                    self._listbox.insert(END, *values)
+                    self._listbox_values = values
                 
             else:
                 self.unpost_listbox()
@@ -163,8 +253,8 @@ class Combobox_Autocomplete(Entry, object):
         height = min(self._listbox_height, len(values))
         self._listbox.configure(height=height)
 
-        for item in values:
-            self._listbox.insert(END, item)
+        self._listbox.insert(END, *values)
+        self._listbox_values = values
 
     def post_listbox(self):
         if self._listbox is not None: return
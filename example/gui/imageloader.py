@@ -0,0 +1,191 @@
+# coding: utf-8
+
+""" Asynchronous loading of the card images for the GUI.
+Images are downloaded and resized by a thread pool and stored as thumbnails in an
+on-disk LRU cache, so the Tk main loop never waits for the network.
+"""
+
+import os
+import io
+import queue
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+def fetchUrl(url, timeout=10):
+    """ Default fetcher. Supports http(s):// as well as file:// urls, e.g. for offline tests """
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def defaultCacheDir():
+    """ Per-user cache directory of the thumbnails, so they are not written into the repository """
+    baseDir = os.environ.get('XDG_CACHE_HOME')
+    if not baseDir and os.name == 'nt':
+        baseDir = os.environ.get('LOCALAPPDATA')
+    if not baseDir:
+        baseDir = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(baseDir, 'omenmachine', 'thumbnails')
+
+
+class ThumbnailCache:
+    """
+    On-disk LRU cache of resized card images, keyed by the Scryfall id of the card.
+    Every thumbnail is one PNG file. Its modification time marks the last use,
+    so the least recently used files are removed once there are more than maxEntries.
+    """
+
+    def __init__(self, cacheDir=None, maxEntries=2000):
+        """
+        :param cacheDir: Directory of the thumbnails, which is created if needed. None uses defaultCacheDir()
+        :param maxEntries: Maximum number of thumbnails that are kept
+        """
+        self.cacheDir = defaultCacheDir() if cacheDir is None else cacheDir
+        self.maxEntries = maxEntries
+        self._lock = threading.Lock()
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, '{0}.png'.format(key))
+
+
+    def get(self, key):
+        """ Thumbnail of a key as PIL image, or None if it is not cached """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as openFile:
+                img = Image.open(io.BytesIO(openFile.read()))
+                img.load()
+            os.utime(path) # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return img
+
+
+    def put(self, key, img):
+        path = self._path(key)
+        # Write to a temporary file first, so a reader never sees a partial image
+        tmpPath = '{0}.{1}.tmp'.format(path, threading.get_ident())
+        img.save(tmpPath, format='PNG')
+        os.replace(tmpPath, path)
+        self._evict()
+
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cacheDir):
+                if entry.name.endswith('.png'):
+                    try:
+                        entries.append((entry.stat().st_mtime_ns, entry.path))
+                    except OSError:
+                        pass
+            if len(entries) <= self.maxEntries:
+                return
+
+            entries.sort()
+            for _, path in entries[:len(entries)-self.maxEntries]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.cacheDir) if name.endswith('.png'))
+
+
+class ImageLoader:
+    """
+    Background loader of card thumbnails.
+    Requests are served from the ThumbnailCache or fetched and resized by a thread pool.
+    Finished images are passed back through a queue, which the Tk main loop empties with
+    poll, because Tk widgets and PhotoImages must only be used from the main thread.
+    """
+
+    def __init__(self, cache, size, fetch=fetchUrl, nWorkers=8):
+        """
+        :param cache: ThumbnailCache, or None to disable caching
+        :param size: (width, height) of the thumbnails
+        :param fetch: Function that returns the raw bytes of an url
+        :param nWorkers: Number of download threads
+        """
+        self.cache = cache
+        self.size = size
+        self.fetch = fetch
+        self._executor = ThreadPoolExecutor(max_workers=nWorkers)
+        self._results = queue.Queue()
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+
+    def _load(self, key, url):
+        img = self.cache.get(key) if self.cache is not None else None
+        if img is None:
+            img = Image.open(io.BytesIO(self.fetch(url)))
+            img = img.convert('RGBA').resize(self.size, Image.LANCZOS)
+            if self.cache is not None:
+                self.cache.put(key, img)
+        return img
+
+
+    def _run(self, key, url):
+        try:
+            result = self._load(key, url)
+        except Exception as error:
+            result = error
+        self._results.put((key, result))
+
+
+    def request(self, key, url, callback):
+        """ Load a thumbnail in the background
+
+        :param key: Cache key, e.g. the Scryfall id of the card
+        :param url: Url of the full image
+        :param callback: Called by poll in the main thread with the PIL image,
+                         or with the exception if loading failed
+        """
+        with self._lock:
+            callbacks = self._callbacks.setdefault(key, [])
+            callbacks.append(callback)
+            if len(callbacks) > 1:
+                # The image is already requested, no need for a second download
+                return
+        self._executor.submit(self._run, key, url)
+
+
+    def cancel(self, callback):
+        """ Drop a callback whose widget does not exist anymore. Running downloads still fill the cache """
+        with self._lock:
+            for callbacks in self._callbacks.values():
+                if callback in callbacks:
+                    callbacks.remove(callback)
+
+
+    def processResults(self):
+        """ Pass all finished images to their callbacks. Returns the number of finished images """
+        nResults = 0
+        while True:
+            try:
+                key, result = self._results.get_nowait()
+            except queue.Empty:
+                return nResults
+            with self._lock:
+                callbacks = self._callbacks.pop(key, [])
+            for callback in callbacks:
+                callback(result)
+            nResults += 1
+
+
+    def poll(self, widget, interval=50):
+        """ Process the finished images every interval milliseconds in the Tk main loop of widget """
+        self.processResults()
+        widget.after(interval, self.poll, widget, interval)
+
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,99 @@
+# coding: utf-8
+
+""" Background worker for the GUI.
+Slow calls, e.g. loading the model or querying similar cards, run in one worker thread
+and their results are passed back to the Tk main loop, which polls them with after().
+"""
+
+import queue
+import threading
+
+
+class Job:
+    """ Handle of a submitted call. A cancelled job does not call its callback """
+
+    def __init__(self, function, args, kwargs, callback, errback):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.errback = errback
+        self.cancelled = False
+
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Worker:
+    """
+    Runs submitted calls one after another in a daemon thread.
+    All calls share the thread, so objects like the OmenMachine are never used concurrently.
+    Callbacks are called in the thread that runs poll, i.e. the Tk main thread.
+    """
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if job.cancelled:
+                continue
+            try:
+                result = job.function(*job.args, **job.kwargs)
+                failed = False
+            except Exception as error:
+                result = error
+                failed = True
+            self._results.put((job, result, failed))
+
+
+    def submit(self, function, *args, callback=None, errback=None, **kwargs):
+        """ Call function(*args, **kwargs) in the worker thread
+
+        :param callback: Called with the result in the main thread
+        :param errback: Called with the exception in the main thread if the call fails
+
+        Returns (Job) handle that can be cancelled, e.g. when the user resubmits a query
+        """
+        job = Job(function, args, kwargs, callback, errback)
+        self._jobs.put(job)
+        return job
+
+
+    def processResults(self):
+        """ Pass all finished results to their callbacks. Returns the number of finished jobs """
+        nResults = 0
+        while True:
+            try:
+                job, result, failed = self._results.get_nowait()
+            except queue.Empty:
+                return nResults
+            nResults += 1
+            if job.cancelled:
+                continue
+            if failed:
+                if job.errback is None:
+                    raise result
+                job.errback(result)
+            elif job.callback is not None:
+                job.callback(result)
+
+
+    def poll(self, widget, interval=50):
+        """ Process the finished jobs every interval milliseconds in the Tk main loop of widget """
+        try:
+            self.processResults()
+        finally:
+            widget.after(interval, self.poll, widget, interval)
+
+
+    def shutdown(self):
+        self._jobs.put(None)
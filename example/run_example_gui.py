@@ -9,16 +9,16 @@ import numpy as np
 import pandas as pd
 import tkinter as tk
 from tkinter import ttk
-import urllib.parse
 from PIL import Image, ImageTk
-import io
 import webbrowser
 sys.path.append('../')
 
 import omenmachine
 from run_example import prepOM
 sys.path.append('./gui')
-from autocompgui import Combobox_Autocomplete
+from autocompgui import Combobox_Autocomplete, Prefix_Completer
+from imageloader import ImageLoader, ThumbnailCache
+from worker import Worker
 
 
 class OMgui(tk.Tk):
@@ -26,9 +26,20 @@ class OMgui(tk.Tk):
     def __init__(self):
         tk.Tk.__init__(self)
         self._frame = None
+        self.om = None
+        self.queryJob = None
 
-        # Prepare ML class
-        self.om = prepOM()
+        # Loading the model and querying cards run in a background thread
+        self.worker = Worker()
+        self.worker.poll(self)
+
+        # Card images are loaded in the background and cached as thumbnails on disk
+        # For a normal card the image will be (672, 936)
+        # Special Cards, e.g. a "Plane" will be forced to match this size
+        scaleFactor = .3
+        self.imageSize = (int(672*scaleFactor), int(936*scaleFactor))
+        self.imageLoader = ImageLoader(ThumbnailCache(), self.imageSize)
+        self.imageLoader.poll(self)
 
         # General settings
         self.pady = 5
@@ -39,9 +50,41 @@ class OMgui(tk.Tk):
         self.TopPage = TopPage(self)
         self.TopPage.pack()
 
+        # Prepare ML class, which may need to run the full runML
+        self.switchFrame(LoadingPage)
+        self.worker.submit(prepOM, callback=self.onModelLoaded, errback=self._frame.showError)
+
+
+    def onModelLoaded(self, om):
+        self.om = om
+
+        # Autocomplete backend for the card names, shared by all query pages
+        self.nameCompleter = Prefix_Completer(self.om.uniqueNames, max_results=50)
+
         self.switchFrame(QueryPage)
 
 
+    def submitQuery(self, callback, errback):
+        """ Query the similar cards in the background. A previous query that is still running is cancelled """
+        if self.queryJob is not None:
+            self.queryJob.cancel()
+
+        self.queryJob = self.worker.submit(
+            self.om.getSimilarCards,
+            self.magicCard,
+            self.cmcFilter,
+            self.colorFilter,
+            self.commanderFilter,
+            self.typeFilter,
+            self.rarityFilter,
+            self.legalityFilter,
+            self.queryNumber,
+            callback=callback,
+            errback=errback
+            )
+        return self.queryJob
+
+
     def switchFrame(self, frameClass):
         newFrame = frameClass(self)
         if self._frame is not None:
@@ -76,6 +119,27 @@ class TopPage(tk.Frame):
         title.grid(row=0, column=2, sticky=tk.W+tk.E, columnspan=6)
 
 
+class LoadingPage(tk.Frame):
+    ''' Progress indicator while the model is loaded or built '''
+    def __init__(self, master):
+        tk.Frame.__init__(self, master)
+
+        self.label = tk.Label(self, text='Loading the card model...')
+        self.label.grid(row=0, column=0, sticky=tk.W+tk.E)
+
+        self.progress = ttk.Progressbar(self, mode='indeterminate', length=300)
+        self.progress.grid(row=1, column=0, sticky=tk.W+tk.E, pady=master.pady)
+        self.progress.start(10)
+
+        exitButton = tk.Button(self, text='Quit', width=master.width, command=master.destroy)
+        exitButton.grid(row=2, column=0)
+
+
+    def showError(self, error):
+        self.progress.stop()
+        self.label.configure(text='Could not load the card model:\n{0}'.format(error))
+
+
 class QueryPage(tk.Frame):
     def __init__(self, master):
         tk.Frame.__init__(self, master)
@@ -90,7 +154,7 @@ class QueryPage(tk.Frame):
         cardLabel = tk.Label(self, anchor="w", text='Magic Card Name:')
         cardLabel.grid(row=row, column=0, sticky=tk.W+tk.E)
         
-        self.cardName = Combobox_Autocomplete(self, master.om.uniqueNames, highlightthickness=1)
+        self.cardName = Combobox_Autocomplete(self, autocomplete_function=master.nameCompleter, highlightthickness=1)
         self.cardName.grid(row=row, column=1, sticky=tk.W+tk.E, columnspan=3)
         row+=1
 
@@ -331,86 +395,111 @@ class ResultPage(tk.Frame):
     def __init__(self, master):
         tk.Frame.__init__(self, master)
 
-        row=0
+        self.imgCallbacks = []
 
-        df = master.om.getSimilarCards(
-            master.magicCard,
-            master.cmcFilter,
-            master.colorFilter,
-            master.commanderFilter,
-            master.typeFilter,
-            master.rarityFilter,
-            master.legalityFilter,
-            master.queryNumber
-            )
+        # Progress indicator until the query is done
+        self.status = tk.Label(self, text='Searching cards similar to {0}...'.format(master.magicCard))
+        self.status.grid(row=0, column=0, sticky=tk.W+tk.E, columnspan=5)
+
+        self.progress = ttk.Progressbar(self, mode='indeterminate', length=300)
+        self.progress.grid(row=1, column=0, columnspan=5, pady=master.pady)
+        self.progress.start(10)
+
+        self.createButtons(row=2)
+
+        self.queryJob = master.submitQuery(callback=self.showResults, errback=self.showError)
+
+
+    def createButtons(self, row):
+        # Button to exit window
+        exitButton = tk.Button(self, text='Quit', width=self.master.width, command=self.master.destroy)
+        exitButton.grid(row=row, column=0, sticky=tk.W+tk.E)
+
+        # Button to reset querry
+        resetButton = tk.Button(self, text='Reset', width=self.master.width, command=lambda: self.master.switchFrame(QueryPage))
+        resetButton.grid(row=row, column=1, sticky=tk.W+tk.E)
+
+
+    def showError(self, error):
+        self.progress.destroy()
+        self.status.configure(text='The query failed: {0}'.format(error))
+
+
+    def showResults(self, df):
+        self.progress.destroy()
+
+        if not isinstance(df, pd.DataFrame):
+            # getSimilarCards returns -1 if the card is unknown
+            self.status.configure(text='{0} is not in the database.'.format(self.master.magicCard))
+            return
+        self.status.destroy()
+
+        for widget in self.grid_slaves():
+            widget.destroy()
 
         # Get images
         row=0
 
         ii=0
-        images = []
 
         for index, rowDf in df.iterrows():
+            # For double-faced cards, this is the image of the front face
             imgUrl = rowDf['image_uris.large']
 
-            if imgUrl != imgUrl:
-                # Check if imgUrl is nan
-                # Then URL is stored in cardfaces
-                imgUrl = rowDf['card_faces'][0]['image_uris']['large']
-
             if ii != 0 and ii % 5 == 0: # do a line break every 5 columns
                 row+=1
                 ii=0
 
-            image = self.createImgOutput(
+            self.createImgOutput(
+                rowDf['id'],
                 rowDf['name'],
                 rowDf['scryfall_uri'],
                 imgUrl,
                 rowDf['sim_value'],
                 row, ii)
 
-            # Keep the reference by appending to list
-            images.append(image)
-
             ii+=1
 
         row+=1
 
-        # Button to exit window
-        exitButton = tk.Button(self, text='Quit', width=master.width, command=master.destroy)
-        exitButton.grid(row=row, column=0, sticky=tk.W+tk.E)
+        self.createButtons(row)
 
-        # Button to reset querry
-        resetButton = tk.Button(self, text='Reset', width=master.width, command=lambda: master.switchFrame(QueryPage))
-        resetButton.grid(row=row, column=1, sticky=tk.W+tk.E)
 
+    def destroy(self):
+        # A result that arrives after the page is gone is dropped
+        self.queryJob.cancel()
+        # Images that arrive after the page is gone are only stored in the cache
+        for callback in self.imgCallbacks:
+            self.master.imageLoader.cancel(callback)
+        tk.Frame.destroy(self)
 
-    def createImgOutput(self, name, scryUrl, imgUrl, simScore, row, column):
+
+    def createImgOutput(self, cardId, name, scryUrl, imgUrl, simScore, row, column):
         
         def onImgClick(event, scrUrl):
             webbrowser.open(scryUrl, new=0) # new=2 opens it in new tab
 
-        rawImg = urllib.request.urlopen(imgUrl).read()
-        img = Image.open(io.BytesIO(rawImg))
-
-        scaleFactor = .3
-        #w, h = img.size
-        # For a normal card it will be (672, 936)
-        # Speial Cards, e.g. a "Plane" will be forced to match this size
-        w, h = 672, 936
-        size = (np.int(w*scaleFactor), np.int(h*scaleFactor))
-        img = img.resize(size, Image.ANTIALIAS)
-
-        image = ImageTk.PhotoImage(img)
-        imgLabel = tk.Label(self, image=image, text="{0}: {1:.2f}".format(name, simScore), compound=tk.BOTTOM)
-        imgLabel.image = image
+        # Blank placeholder of the final size until the image arrives
+        placeholder = ImageTk.PhotoImage(Image.new('RGBA', self.master.imageSize, (0, 0, 0, 0)))
+        imgLabel = tk.Label(self, image=placeholder, text="{0}: {1:.2f}".format(name, simScore), compound=tk.BOTTOM)
+        imgLabel.image = placeholder
             
         imgLabel.grid(row=row, column=column, sticky=tk.W+tk.E, columnspan=1)
 
         # Bind click event to image
         imgLabel.bind('<Button-1>', lambda event, scryUrl=scryUrl: onImgClick(event, scryUrl))
 
-        return image
+        def onImgLoaded(img):
+            if isinstance(img, Exception):
+                imgLabel.configure(text="{0}: {1:.2f}\n(image not available)".format(name, simScore))
+                return
+            image = ImageTk.PhotoImage(img)
+            imgLabel.configure(image=image)
+            imgLabel.image = image # Keep the reference
+
+        if isinstance(imgUrl, str):
+            self.imgCallbacks.append(onImgLoaded)
+            self.master.imageLoader.request(cardId, imgUrl, onImgLoaded)
 
 if __name__ == '__main__':
     gui = OMgui()
@@ -422,3 +511,5 @@ if __name__ == '__main__':
     gui.minsize(1040,720)
 
     gui.mainloop()
+    gui.worker.shutdown()
+    gui.imageLoader.shutdown()
@@ -1,6 +1,61 @@
 # coding: utf-8
 
 """ Import from sub-modules
+
+The sub-modules are imported when one of their names is first used, e.g. omenmachine.OmenMachine.
+pandas, SciPy, scikit-learn and joblib are only imported by the functions that need them,
+so "import omenmachine" only loads NumPy.
 """
 
-from .card_recommendation import *
\ No newline at end of file
+import importlib
+
+# Public names and the sub-module that defines them
+_exports = {
+    'iterJsonArray': 'card_recommendation',
+    'prepJsonFile': 'card_recommendation',
+    'vectorizeFeatures': 'card_recommendation',
+    'OmenMachine': 'card_recommendation',
+    'TopKIndex': 'similarity_index',
+    'QueryIndex': 'similarity_index',
+    'EmbeddingIndex': 'similarity_index',
+    'MemmapIndex': 'similarity_index',
+    'normalizeRows': 'similarity_index',
+    'blockCosineSimilarity': 'similarity_index',
+    'searchScores': 'similarity_index',
+    'searchScoresBatch': 'similarity_index',
+    'centroidScores': 'similarity_index',
+    'IVFIndex': 'ann_index',
+    'CardMetadata': 'card_metadata',
+    'NameIndex': 'name_index',
+    'defaultFeatures': 'card_features',
+    'combineFeatures': 'card_features',
+    'combineFeaturesParallel': 'card_features',
+    'ResultCache': 'result_cache',
+    'queryKey': 'result_cache',
+    'FeatureWeighting': 'feature_weighting',
+    'Metrics': 'metrics',
+    'logCallback': 'metrics',
+    'disabledMetrics': 'metrics',
+    }
+
+_submodules = {
+    'ann_index', 'card_features', 'cli', 'card_filters', 'card_metadata', 'card_recommendation',
+    'feature_weighting', 'metrics', 'name_index', 'result_cache', 'serve', 'similarity_index',
+    }
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module('.'+_exports[name], __name__), name)
+        # Later lookups do not go through __getattr__
+        globals()[name] = value
+        return value
+    if name in _submodules:
+        return importlib.import_module('.'+name, __name__)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports) | _submodules)
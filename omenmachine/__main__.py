@@ -0,0 +1,10 @@
+# coding: utf-8
+
+""" python -m omenmachine, see omenmachine/cli.py """
+
+import sys
+
+from .cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,225 @@
+# coding: utf-8
+
+import numpy as np
+
+from .similarity_index import normalizeRows, rankScores, reduceDimensions, normalizeVectors
+
+
+def sphericalKMeans(vectors, nClusters, nIter=10, sampleSize=None, seed=0, blockSize=10000):
+    """ Cluster L2-normalized vectors by their cosine similarity to the cluster centroids
+
+    :param vectors: Array (N, d) of L2-normalized vectors
+    :param nClusters: Number of clusters
+    :param nIter: Number of Lloyd iterations
+    :param sampleSize: Number of vectors the centroids are trained on. None uses 256 per cluster
+    :param seed: Seed of the initialization and the sample
+    :param blockSize: Number of vectors that are assigned at once
+
+    Returns (np.ndarray) of L2-normalized centroids (nClusters, d)
+    """
+    import scipy.sparse as sp
+
+    rng = np.random.default_rng(seed)
+    nClusters = max(1, min(nClusters, len(vectors)))
+    if sampleSize is None:
+        sampleSize = 256*nClusters
+    if sampleSize < len(vectors):
+        vectors = vectors[rng.choice(len(vectors), size=sampleSize, replace=False)]
+
+    centroids = vectors[rng.choice(len(vectors), size=nClusters, replace=False)].copy()
+    for _ in range(nIter):
+        labels = assignClusters(vectors, centroids, blockSize)
+        membership = sp.csr_matrix(
+            (np.ones(len(vectors), dtype=np.float32), (labels, np.arange(len(vectors)))),
+            shape=(nClusters, len(vectors))
+            )
+        sums = np.asarray(membership @ vectors)
+
+        # Empty clusters restart at a random vector
+        empty = np.flatnonzero(np.asarray(membership.sum(axis=1)).ravel() == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), size=len(empty))]
+        centroids = normalizeVectors(sums)
+
+    return centroids
+
+
+def assignClusters(vectors, centroids, blockSize=10000):
+    """ Index of the most similar centroid of every vector """
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), blockSize):
+        labels[start:start+blockSize] = np.argmax(vectors[start:start+blockSize] @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """
+    Approximate nearest-neighbour index (inverted file) for catalogs that are too large
+    for the exact all-pairs similarity, e.g. every printing of every card.
+
+    The sparse features are reduced to a few dense dimensions with a truncated SVD and
+    the cards are clustered into nLists lists. A query only visits the nProbe lists whose
+    centroids are most similar to the queried card. The candidates of these lists are ranked
+    with the exact cosine similarity of their sparse features, so the returned scores are exact
+    and only cards in unvisited lists can be missed.
+    A larger nProbe increases the recall and the query time. It can be changed after the build.
+    """
+
+    def __init__(self, names, featureMatrix, vectors, components, centroids, nProbe=8):
+        """
+        :param names: List of card names. The position in the list is the row id
+        :param featureMatrix: L2-normalized sparse matrix (CSR) with one row per card
+        :param vectors: Array (N, d) with the reduced, L2-normalized vectors of the cards
+        :param components: Array (d, nFeatures) that projects feature rows to the reduced space
+        :param centroids: Array (nLists, d) with the L2-normalized centroids of the lists
+        :param nProbe: Number of lists that are visited per query
+        """
+        self.names = list(names)
+        self.featureMatrix = featureMatrix
+        self.vectors = vectors
+        self.components = components
+        self.centroids = centroids
+        self.nProbe = nProbe
+        self._buildLists()
+
+
+    @classmethod
+    def fromCountMatrix(cls, names, countMatrix, nComponents=128, nLists=None, nProbe=8, seed=0):
+        """
+        :param names: List of card names
+        :param countMatrix: Sparse (weighted) count matrix with one row per card
+        :param nComponents: Number of dimensions of the reduced vectors
+        :param nLists: Number of lists. None uses sqrt(N)
+        :param nProbe: Number of lists that are visited per query
+        :param seed: Seed of the SVD and the clustering
+        """
+        featureMatrix = normalizeRows(countMatrix, dtype=np.float32)
+        vectors, components = reduceDimensions(featureMatrix, nComponents, seed=seed)
+        if nLists is None:
+            nLists = int(np.sqrt(len(names)))
+        centroids = sphericalKMeans(vectors, nLists, seed=seed)
+        return cls(names, featureMatrix, vectors, components, centroids, nProbe=nProbe)
+
+
+    def _buildLists(self):
+        labels = assignClusters(self.vectors, self.centroids)
+        # Row ids grouped by list, the rows of list i are listRowIds[listStarts[i]:listStarts[i+1]]
+        self.listRowIds = np.argsort(labels, kind='stable').astype(np.int32)
+        self.listStarts = np.searchsorted(labels[self.listRowIds], np.arange(len(self.centroids)+1))
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    @property
+    def nLists(self):
+        return len(self.centroids)
+
+
+    def _candidates(self, vector):
+        """ Row ids in the nProbe lists that are most similar to a reduced vector """
+        nProbe = max(1, min(self.nProbe, self.nLists))
+        lists = np.argpartition(-(self.centroids @ vector), nProbe-1)[:nProbe]
+        return np.concatenate([self.listRowIds[self.listStarts[ii]:self.listStarts[ii+1]] for ii in lists])
+
+
+    def _scores(self, candidates, query):
+        """ Array with the exact similarity of the candidates to a dense feature vector. All other cards are -np.inf """
+        scores = np.full(len(self.names), -np.inf, dtype=np.float32)
+        scores[candidates] = self.featureMatrix[candidates] @ query
+        return scores
+
+
+    def query(self, rowId, topN=None):
+        """ Return the most similar candidates
+
+        :param rowId: Row id of the queried card
+        :param topN: Number of returned cards. If None, all candidates are returned
+
+        Returns (np.ndarray), (np.ndarray): row ids and exact scores sorted by decreasing score
+        """
+        candidates = self._candidates(self.vectors[rowId])
+        candidates = candidates[candidates != rowId]
+        scores = (self.featureMatrix[candidates] @ self.featureMatrix[rowId].T).toarray().ravel()
+
+        order = np.lexsort((candidates, -scores))
+        if topN is not None:
+            order = order[:topN]
+        return candidates[order], scores[order]
+
+
+    def batchScores(self, rowIds):
+        """ Similarity of several cards to their candidates. Cards that are not candidates are -np.inf
+
+        :param rowIds: Row ids of the queried cards
+        """
+        rowIds = np.asarray(rowIds)
+        scores = np.empty((len(rowIds), len(self.names)), dtype=np.float32)
+        for ii, rowId in enumerate(rowIds):
+            scores[ii] = self._scores(self._candidates(self.vectors[rowId]), self.featureMatrix[rowId].toarray().ravel())
+        return scores
+
+
+    def centroidScores(self, rowIds, weights):
+        """ Cosine similarity of the candidates to the weighted centroid of several cards.
+        Cards that are not candidates are -np.inf
+
+        :param rowIds: Row ids of the cards
+        :param weights: Weight of each card
+        """
+        centroid = np.asarray(weights, dtype=np.float32) @ self.featureMatrix[rowIds]
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid /= norm
+
+        vector = np.asarray(weights, dtype=np.float32) @ self.vectors[rowIds]
+        return self._scores(self._candidates(vector/max(np.linalg.norm(vector), 1e-12)), centroid)
+
+
+    def update(self, names, featureMatrix, affectedIds, blockSize=1000):
+        """ Project the added and changed cards with the existing components and assign them to
+        the existing lists. Tokens that are new to the vocabulary do not change the projection.
+
+        :param names: List of all card names after the update
+        :param featureMatrix: L2-normalized sparse matrix of all cards after the update
+        :param affectedIds: Row ids of the added and changed cards
+        :param blockSize: Number of rows that are projected at once
+        """
+        affectedIds = np.asarray(affectedIds, dtype=np.intp)
+        featureMatrix = featureMatrix.astype(np.float32).tocsr()
+
+        vectors = np.zeros((len(names), self.vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+        nFeatures = self.components.shape[1]
+        for start in range(0, len(affectedIds), blockSize):
+            rows = affectedIds[start:start+blockSize]
+            vectors[rows] = normalizeVectors(featureMatrix[rows][:, :nFeatures] @ self.components.T)
+
+        self.names = list(names)
+        self.featureMatrix = featureMatrix
+        self.vectors = vectors
+        self._buildLists()
+
+
+def exactRecall(index, exactIndex, rowIds, topN=10):
+    """ Fraction of the exact topN most similar cards that an approximate index returns
+
+    :param index: Approximate index, e.g. IVFIndex
+    :param exactIndex: Exact index, e.g. QueryIndex
+    :param rowIds: Row ids of the queried cards
+    :param topN: Number of compared cards per query
+    """
+    recall = []
+    for rowId in rowIds:
+        rowScores = exactIndex.rowScores(rowId)
+        exactIds, exactScores = rankScores(rowScores, rowId, topN)
+        if len(exactIds) == 0:
+            # e.g. topN=0 or a catalog with one card
+            recall.append(1.)
+            continue
+
+        approxIds, _ = index.query(rowId, topN)
+        # Cards tied with the last exact score are all correct answers
+        correct = np.union1d(exactIds, np.flatnonzero(rowScores >= exactScores[-1]))
+        recall.append(np.isin(approxIds, correct).sum()/len(exactIds))
+    return float(np.mean(recall)) if recall else 1.
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+import os
+import re
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+
+# The relevant features that are combined for every card
+defaultFeatures = ['cmc', 'mana_cost', 'type_line', 'oracle_text', 'power', 'toughness']
+
+# Description text in parenthesis, e.g. "(Sacrifice a land, Discard this card: Draw a card.)"
+reminderTextPattern = re.compile(r" ?\([^)]+\)")
+
+_missing = object()
+
+
+def combineFeatures(card, features=defaultFeatures, chatty=False):
+    """ Combine the features of a card in one string
+
+    :param card: Dictionary of an individual card on Scryfall
+    :param features: List of the features that are combined
+    :param chatty: Print the card properties in case there is an error
+    """
+    cardString = ''
+    try:
+        for feature in features:
+            value = card.get(feature, _missing)
+            if value is not _missing:
+                featureString = str(value)
+            else:
+                # Cards with "Transform" need to be treated differently.
+                # Their oracle text is split for the different card_faces,
+                # e.g. "Delver of Secrets // Insectile Aberration".
+                # Cards without the feature, e.g. an Instant and power/toughness,
+                # pass an empty string. This choice depends on the posed problem
+                featureString = ''
+                cardFaces = card.get('card_faces', _missing)
+                if cardFaces is not _missing:
+                    for cf in (0, 1):
+                        faceValue = cardFaces[cf].get(feature, _missing)
+                        if faceValue is _missing:
+                            break
+                        featureString += faceValue+' '
+
+            # Add feature string to card string
+            cardString += featureString+' '
+
+    except Exception:
+        if chatty:
+            # Print the card properties in case there is an error
+            print(card)
+
+    # Remove possible description text in parenthesis.
+    # For example: "Cycling—Sacrifice a land. (Sacrifice a land, Discard this card: Draw a card.)"
+    # This will be reduced to: "Cycling—Sacrifice a land."
+    cardString = reminderTextPattern.sub('', cardString)
+    # Remove additional irrelevant characters from
+    # e.g. Fuse cards like "Wear // Tear"
+    cardString = cardString.replace('//', '').replace('—', '')
+    return ' '.join(cardString.split()) # Remove multiple white spaces
+
+
+def combineFeaturesParallel(cards, features=defaultFeatures, nJobs=1, chunkSize=1000, chatty=False):
+    """ Combine the features of many cards across a process pool
+
+    :param cards: List of card dictionaries
+    :param features: List of the features that are combined
+    :param nJobs: Number of processes. None uses all cores, 1 runs in the current process
+    :param chunkSize: Number of cards that are sent to a process at once
+    :param chatty: Print the card properties in case there is an error
+
+    Returns (list) of combined feature strings in the order of the cards
+    """
+    if nJobs is None or nJobs < 1:
+        nJobs = os.cpu_count() or 1
+
+    if nJobs == 1 or len(cards) <= chunkSize:
+        return [combineFeatures(card, features, chatty) for card in cards]
+
+    combine = functools.partial(combineFeatures, features=features, chatty=chatty)
+    with ProcessPoolExecutor(max_workers=nJobs) as executor:
+        return list(executor.map(combine, cards, chunksize=chunkSize))
@@ -0,0 +1,237 @@
+# coding: utf-8
+
+import re
+import operator
+
+import numpy as np
+
+from .metrics import disabledMetrics
+
+
+# Bits used to encode colors and color identities
+allColors = ['W', 'U', 'B', 'R', 'G', 'C']
+colorBits = {color: 1 << bit for bit, color in enumerate(allColors)}
+
+# Card types that are encoded as bits. Other type filters fall back to a substring search
+defaultTypes = ['Artifact', 'Conspiracy', 'Creature', 'Emblem',
+                'Enchantment', 'Hero', 'Instant', 'Land',
+                'Phenomenon', 'Plane ', 'Planeswalker', 'Scheme',
+                'Sorcery', 'Tribal', 'Vanguard']
+
+defaultRarities = ['common', 'mythic', 'rare', 'uncommon']
+
+cmcOperators = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    }
+
+cmcPattern = re.compile(r'^\s*(>=|<=|==|!=|>|<)\s*([-+]?(?:\d+\.?\d*|\.\d+))\s*$')
+
+
+def encodeColors(colors):
+    """ Encode a list of colors, e.g. ['G', 'R'], as bitmask """
+    bits = 0
+    for color in colors:
+        bits |= colorBits.get(color, 0)
+    return bits
+
+
+def _isNan(value):
+    return isinstance(value, float) and value != value
+
+
+def _cardColors(colors, cardFaces):
+    """ Colors of a card as used by the color filter.
+    Flip/Fuse/Transform cards store their colors in "card_faces".
+    """
+    if _isNan(colors) or colors is None:
+        colors = cardFaces[0]['colors']
+        if len(colors) == 0:
+            colors = ['C']
+    return colors
+
+
+class CardAttributes:
+    """
+    Card attributes that are used by the filters of getSimilarCards, encoded once as NumPy arrays.
+    Every filter becomes a vectorized expression and all filters combine to one boolean mask.
+    """
+
+    # Attributes that are stored as arrays and as lists of names.
+    # typeLineNames is an object array of variable-length strings
+    arrayNames = ['cmc', 'typeLineNames', 'typeLineCodes', 'types', 'rarity', 'colors', 'colorIdentity', 'legal']
+    listNames = ['typeNames', 'rarityNames', 'formatNames']
+
+    def __init__(self, cards):
+        """
+        :param cards: Data frame (or dictionary of columns) with the flattened Scryfall
+                      information of the cards, e.g. json_normalize of the unique json file
+        """
+        nCards = len(cards['name'])
+
+        # Converted mana cost
+        self.cmc = np.asarray(cards['cmc'], dtype=np.float64)
+
+        # Card types as bits and the type line for all other type filters.
+        # Many cards share a type line, so the distinct type lines are stored once with a code per card
+        typeLines = np.array([str(typeLine) for typeLine in cards['type_line']], dtype=object)
+        self.typeLineNames, typeLineCodes = np.unique(typeLines, return_inverse=True)
+        self.typeLineCodes = typeLineCodes.astype(np.int32)
+        self.typeNames = list(defaultTypes)
+        self.types = np.zeros(nCards, dtype=np.uint32)
+        for bit, typeName in enumerate(self.typeNames):
+            self.types[self._typeLineMatches(typeName)[self.typeLineCodes]] |= np.uint32(1 << bit)
+
+        # Rarities as codes
+        self.rarityNames, self.rarity = np.unique(
+            np.array([str(rarity) for rarity in cards['rarity']]), return_inverse=True
+            )
+        self.rarityNames = list(self.rarityNames)
+
+        # Colors and color identity as bits
+        cardFaces = cards['card_faces'] if 'card_faces' in cards else [np.nan]*nCards
+        self.colors = np.array(
+            [encodeColors(_cardColors(colors, faces)) for colors, faces in zip(cards['colors'], cardFaces)],
+            dtype=np.uint8
+            )
+        self.colorIdentity = np.array(
+            [encodeColors(colorIdentity) for colorIdentity in cards['color_identity']], dtype=np.uint8
+            )
+
+        # Legality in the different formats as bits. A card is legal unless it is "not_legal"
+        self.formatNames = [column.split('.', 1)[1] for column in cards.keys() if column.startswith('legalities.')]
+        self.legal = np.zeros(nCards, dtype=np.uint64)
+        for bit, formatName in enumerate(self.formatNames):
+            legalities = np.array([str(legality) for legality in cards['legalities.{0}'.format(formatName)]])
+            self.legal[legalities != 'not_legal'] |= np.uint64(1 << bit)
+
+
+    def toArrays(self):
+        """ Dictionary of NumPy arrays from which the attributes can be restored without pickling """
+        arrays = {name: getattr(self, name) for name in self.arrayNames}
+        arrays.update({name: np.array(getattr(self, name), dtype=str) for name in self.listNames})
+        return arrays
+
+
+    @classmethod
+    def fromArrays(cls, arrays):
+        """ Restore the attributes from the output of toArrays """
+        attributes = cls.__new__(cls)
+        for name in cls.arrayNames:
+            setattr(attributes, name, arrays[name])
+        for name in cls.listNames:
+            setattr(attributes, name, [str(value) for value in arrays[name]])
+        return attributes
+
+
+    def __len__(self):
+        return len(self.cmc)
+
+
+    def _typeLineMatches(self, typeName):
+        """ Boolean array that tells which distinct type lines contain a string """
+        return np.array([typeName in typeLine for typeLine in self.typeLineNames], dtype=bool)
+
+
+    def cmcMask(self, cmcFilter, rowIds=slice(None)):
+        """
+        :param cmcFilter: Comparison with the converted mana cost, e.g. ">=0" or "<3"
+        """
+        match = cmcPattern.match(cmcFilter)
+        if match is None:
+            raise ValueError('Invalid cmcFilter {0}. Use e.g. ">=2".'.format(cmcFilter))
+        compare = cmcOperators[match.group(1)]
+        return compare(self.cmc[rowIds], float(match.group(2)))
+
+
+    def typeMask(self, typeFilter, rowIds=slice(None)):
+        """
+        :param typeFilter: List of strings. Cards pass if their type line contains any of them
+        """
+        bits = 0
+        mask = np.zeros(len(self.types[rowIds]), dtype=bool)
+        for typeName in typeFilter:
+            if typeName in self.typeNames:
+                bits |= 1 << self.typeNames.index(typeName)
+            else:
+                mask |= self._typeLineMatches(typeName)[self.typeLineCodes[rowIds]]
+        return mask | ((self.types[rowIds] & np.uint32(bits)) != 0)
+
+
+    def rarityMask(self, rarityFilter, rowIds=slice(None)):
+        """
+        :param rarityFilter: List of rarities that pass
+        """
+        codes = [self.rarityNames.index(rarity) for rarity in rarityFilter if rarity in self.rarityNames]
+        return np.isin(self.rarity[rowIds], codes)
+
+
+    def colorMask(self, colorFilter, rowIds=slice(None)):
+        """
+        :param colorFilter: List of colors that a card has to contain,
+                            e.g. [G,R] will show Gruul cards but for example also [W,G,R].
+        """
+        if any(color not in colorBits for color in colorFilter):
+            # No card has an unknown color
+            return np.zeros(len(self.colors[rowIds]), dtype=bool)
+        bits = np.uint8(encodeColors(colorFilter))
+        return (self.colors[rowIds] & bits) == bits
+
+
+    def commanderMask(self, commanderFilter, rowIds=slice(None)):
+        """
+        :param commanderFilter: List of colors of the commander.
+                                Cards pass if their color identity is within these colors
+        """
+        antiCommanderFilter = [ac for ac in allColors if not any(cf in ac for cf in commanderFilter)]
+        return (self.colorIdentity[rowIds] & np.uint8(encodeColors(antiCommanderFilter))) == 0
+
+
+    def legalityMask(self, legalityFilter, rowIds=slice(None)):
+        """
+        :param legalityFilter: Format or list of formats in which a card must not be "not_legal"
+        """
+        bits = 0
+        for formatName in np.atleast_1d(legalityFilter):
+            if formatName not in self.formatNames:
+                raise KeyError('legalities.{0}'.format(formatName))
+            bits |= 1 << self.formatNames.index(formatName)
+        bits = np.uint64(bits)
+        return (self.legal[rowIds] & bits) == bits
+
+
+    def mask(self, cmcFilter='>=0', colorFilter=None, commanderFilter=allColors,
+             typeFilter=defaultTypes, rarityFilter=defaultRarities, legalityFilter=None, rowIds=None,
+             metrics=disabledMetrics):
+        """ Combine all filters of getSimilarCards into one boolean mask
+
+        :param rowIds: Row ids of the cards that are filtered. If None, all cards are filtered
+        :param metrics: Metrics that time every filter step
+
+        Returns (np.ndarray) boolean mask, which is aligned with rowIds
+        """
+        if rowIds is None:
+            rowIds = slice(None)
+            metrics.count('filteredCards', len(self))
+        else:
+            metrics.count('filteredCards', len(rowIds))
+
+        with metrics.timer('filter', filter='cmc'):
+            mask = self.cmcMask(cmcFilter, rowIds)
+        with metrics.timer('filter', filter='type'):
+            mask &= self.typeMask(typeFilter, rowIds)
+        with metrics.timer('filter', filter='rarity'):
+            mask &= self.rarityMask(rarityFilter, rowIds)
+        if colorFilter is not None:
+            with metrics.timer('filter', filter='color'):
+                mask &= self.colorMask(colorFilter, rowIds)
+        with metrics.timer('filter', filter='commander'):
+            mask &= self.commanderMask(commanderFilter, rowIds)
+        if legalityFilter is not None:
+            with metrics.timer('filter', filter='legality'):
+                mask &= self.legalityMask(legalityFilter, rowIds)
+        return mask
@@ -0,0 +1,283 @@
+# coding: utf-8
+
+import os
+import json
+
+import numpy as np
+
+from .card_filters import CardAttributes
+
+
+# Columns that are kept for the output of getSimilarCards and the GUI
+metadataColumns = ['name', 'id', 'set', 'scryfall_uri', 'image_uris.large',
+                   'cmc', 'mana_cost', 'type_line', 'oracle_text', 'power', 'toughness',
+                   'colors', 'color_identity', 'rarity']
+
+# Columns with few distinct values, which get a categorical dtype
+categoricalColumns = ['set', 'mana_cost', 'type_line', 'power', 'toughness',
+                      'colors', 'color_identity', 'rarity']
+
+# Columns that hold a list of colors
+listColumns = ['colors', 'color_identity']
+
+_missing = object()
+
+
+def _faceValue(cardFaces, column):
+    """ Value of a column for Flip/Fuse/Transform cards, which store it in "card_faces" """
+    if column == 'image_uris.large':
+        return cardFaces[0].get('image_uris', {}).get('large', _missing)
+    if column in ('mana_cost', 'oracle_text'):
+        values = [face[column] for face in cardFaces if face.get(column)]
+        return ' // '.join(values) if values else _missing
+    return cardFaces[0].get(column, _missing)
+
+
+def _cardValue(card, column):
+    if column.startswith('legalities.') or column == 'image_uris.large':
+        key, subKey = column.split('.', 1)
+        value = card.get(key, {}).get(subKey, _missing)
+    else:
+        value = card.get(column, _missing)
+
+    if value is _missing and 'card_faces' in card:
+        value = _faceValue(card['card_faces'], column)
+    return value
+
+
+def _encodeStrings(values):
+    """ Encode a list of strings (None if missing) as codes and an object array of categories """
+    categories = sorted({value for value in values if value is not None})
+    lookup = {value: code for code, value in enumerate(categories)}
+    codes = np.array([lookup.get(value, -1) if value is not None else -1 for value in values],
+                     dtype=np.int16 if len(categories) < 2**15 else np.int32)
+    return codes, _objectArray(categories)
+
+
+def _objectArray(strings):
+    array = np.empty(len(strings), dtype=object)
+    array[:] = strings
+    return array
+
+
+def packStrings(strings):
+    """ Variable-length strings as UTF-8 bytes and offsets, so no string is padded to the longest one
+
+    Returns (np.ndarray), (np.ndarray): uint8 data and int64 offsets, string i is data[offsets[i]:offsets[i+1]]
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpackStrings(data, offsets):
+    """ Object array of the strings packed by packStrings """
+    text = data.tobytes()
+    offsets = offsets.tolist()
+    return _objectArray([text[start:stop].decode('utf-8') for start, stop in zip(offsets[:-1], offsets[1:])])
+
+
+class CardMetadata:
+    """
+    Compact, columnar store of the card information that is used when querying cards.
+    String columns are stored as codes and categories, double-faced fields are resolved
+    from "card_faces", and the encoded filter attributes are stored along with them.
+    The store is written once to a NumPy .npz file next to the unique json file and is
+    loaded from there as long as the json file does not change.
+    """
+
+    # Increase when the layout of the cache file changes
+    version = 2
+
+    def __init__(self, columns, cmc, attributes):
+        """
+        :param columns: Dictionary of column name and (codes, categories) of the string columns.
+                        The categories are object arrays of strings
+        :param cmc: Array with the converted mana cost
+        :param attributes: CardAttributes used by the filters
+        """
+        self.columns = columns
+        self.cmc = cmc
+        self.attributes = attributes
+        # Size and modification time of the json file the metadata was created from
+        self.source = None
+        self._df = None
+        # Categorical dtypes of the output columns, created once when a data frame is first built
+        self._dtypes = {}
+
+
+    @classmethod
+    def fromCards(cls, cards):
+        """
+        :param cards: List of card dictionaries, e.g. the unique json file
+        """
+        formatNames = sorted({formatName for card in cards for formatName in card.get('legalities', {})})
+        legalityColumns = ['legalities.{0}'.format(formatName) for formatName in formatNames]
+
+        values = {column: [] for column in metadataColumns+legalityColumns}
+        for card in cards:
+            for column, columnValues in values.items():
+                value = _cardValue(card, column)
+                if value is _missing or value is None:
+                    columnValues.append(None)
+                elif column in listColumns:
+                    columnValues.append(','.join(value))
+                elif column == 'cmc':
+                    columnValues.append(value)
+                else:
+                    columnValues.append(str(value))
+
+        cmc = np.array([np.nan if value is None else value for value in values.pop('cmc')], dtype=np.float64)
+
+        # The filters use the unresolved colors, because colorless double-faced cards count as "C"
+        attributes = CardAttributes({
+            'name': values['name'],
+            'cmc': cmc,
+            'type_line': [np.nan if value is None else value for value in values['type_line']],
+            'rarity': [np.nan if value is None else value for value in values['rarity']],
+            'colors': [card.get('colors', np.nan) for card in cards],
+            'card_faces': [card.get('card_faces', np.nan) for card in cards],
+            'color_identity': [card.get('color_identity', []) for card in cards],
+            **{column: [np.nan if value is None else value for value in values[column]] for column in legalityColumns}
+            })
+
+        columns = {column: _encodeStrings(columnValues) for column, columnValues in values.items()}
+        return cls(columns, cmc, attributes)
+
+
+    @classmethod
+    def fromJsonFile(cls, jsonFile, chatty=False):
+        """ Load the metadata of a json file from its cache file, or create the cache file
+
+        :param jsonFile: Path to Scryfall's json file after filtering with the prepJsonFile function
+        """
+        cacheFile = jsonFile+'.meta.npz'
+        stat = os.stat(jsonFile)
+        source = np.array([stat.st_size, stat.st_mtime_ns, cls.version], dtype=np.int64)
+
+        if os.path.isfile(cacheFile):
+            try:
+                metadata = cls.load(cacheFile)
+            except (KeyError, ValueError, OSError):
+                # Cache file of an older layout, which is written again
+                metadata = None
+            if metadata is not None and np.array_equal(metadata.source, source):
+                return metadata
+
+        with open(jsonFile) as openFile:
+            metadata = cls.fromCards(json.load(openFile))
+        metadata.source = source
+
+        try:
+            metadata.save(cacheFile)
+        except OSError as error:
+            if chatty:
+                print('Could not write the metadata cache {0}: {1}'.format(cacheFile, error))
+
+        return metadata
+
+
+    def save(self, cacheFile):
+        arrays = {'source': self.source, 'cmc': self.cmc}
+        for column, (codes, categories) in self.columns.items():
+            arrays['columns.{0}.codes'.format(column)] = codes
+            self._saveStrings(arrays, 'columns.{0}.categories'.format(column), categories)
+        for name, array in self.attributes.toArrays().items():
+            if array.dtype == object:
+                self._saveStrings(arrays, 'attributes.{0}'.format(name), array)
+            else:
+                arrays['attributes.{0}'.format(name)] = array
+
+        # Write to a temporary file first, so other processes never read a partial file
+        with open(cacheFile+'.tmp', 'wb') as outfile:
+            np.savez(outfile, **arrays)
+        os.replace(cacheFile+'.tmp', cacheFile)
+
+
+    @staticmethod
+    def _saveStrings(arrays, key, strings):
+        # Free text, e.g. the oracle text, would be padded to its longest string as fixed-width array
+        arrays[key+'.data'], arrays[key+'.offsets'] = packStrings(strings)
+
+
+    @classmethod
+    def load(cls, cacheFile):
+        with np.load(cacheFile, allow_pickle=False) as arrays:
+            columns = {}
+            attributeArrays = {}
+            for key in arrays.files:
+                if key.startswith('columns.') and key.endswith('.codes'):
+                    column = key[len('columns.'):-len('.codes')]
+                    categoryKey = 'columns.{0}.categories'.format(column)
+                    columns[column] = (arrays[key], unpackStrings(arrays[categoryKey+'.data'], arrays[categoryKey+'.offsets']))
+                elif key.startswith('attributes.') and key.endswith('.data'):
+                    name = key[len('attributes.'):-len('.data')]
+                    attributeArrays[name] = unpackStrings(arrays[key], arrays['attributes.{0}.offsets'.format(name)])
+                elif key.startswith('attributes.') and not key.endswith('.offsets'):
+                    attributeArrays[key[len('attributes.'):]] = arrays[key]
+
+            metadata = cls(columns, arrays['cmc'], CardAttributes.fromArrays(attributeArrays))
+            metadata.source = arrays['source']
+        return metadata
+
+
+    def __len__(self):
+        return len(self.cmc)
+
+
+    @property
+    def names(self):
+        codes, categories = self.columns['name']
+        return [str(name) for name in categories[codes]]
+
+
+    def _decode(self, column, rowIds):
+        codes, categories = self.columns[column]
+        codes = codes[rowIds]
+
+        if column in listColumns:
+            values = []
+            for code in codes:
+                if code < 0:
+                    values.append(np.nan)
+                else:
+                    values.append(categories[code].split(',') if categories[code] else [])
+            return values
+        if column in categoricalColumns or column.startswith('legalities.'):
+            import pandas as pd
+            dtype = self._dtypes.get(column)
+            if dtype is None:
+                dtype = self._dtypes[column] = pd.CategoricalDtype(categories)
+            return pd.Categorical.from_codes(codes, dtype=dtype)
+
+        # Only the values of the selected cards are looked up
+        if len(categories) == 0:
+            return np.full(len(codes), np.nan, dtype=object)
+        values = categories[np.maximum(codes, 0)]
+        values[codes < 0] = np.nan
+        return values
+
+
+    def toDataFrame(self, rowIds=None):
+        """ Data frame with the card information
+
+        :param rowIds: Row ids of the cards. If None, all cards are included
+        """
+        import pandas as pd
+
+        if rowIds is None:
+            rowIds = np.arange(len(self))
+        rowIds = np.asarray(rowIds, dtype=np.intp)
+
+        df = pd.DataFrame({column: self._decode(column, rowIds) for column in self.columns})
+        df.insert(metadataColumns.index('cmc'), 'cmc', self.cmc[rowIds])
+        return df
+
+
+    @property
+    def df(self):
+        """ Data frame with the information of all cards, created when it is first used """
+        if self._df is None:
+            self._df = self.toDataFrame()
+        return self._df
@@ -1,58 +1,180 @@
 # coding: utf-8
 
-import re
 import json
-import joblib
+import os
+import sys
+import time
 
 import numpy as np
-import pandas as pd
-from pandas.io.json import json_normalize
 
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+# pandas, SciPy, scikit-learn and joblib are imported when they are first needed,
+# so a process that only loads prebuilt similarity information and queries cards starts fast.
+from .similarity_index import TopKIndex, QueryIndex, EmbeddingIndex, MemmapIndex, normalizeRows, blockCosineSimilarity
+from .similarity_index import searchScores, searchScoresBatch, centroidScores
+from .card_metadata import CardMetadata
+from .card_filters import allColors, defaultTypes, defaultRarities
+from .name_index import NameIndex
+from .card_features import defaultFeatures, combineFeatures, combineFeaturesParallel
+from .result_cache import ResultCache, queryKey
+from .ann_index import IVFIndex
+from .feature_weighting import FeatureWeighting
+from .metrics import disabledMetrics
+
+def iterJsonArray(openFile, chunkSize=1 << 20):
+    """ Iterate over the objects of a json array without loading the whole file.
+    The file is read in chunks and every object is decoded as soon as it is complete.
+
+    :param openFile: Opened json file that contains an array of objects, e.g. Scryfall's bulk data
+    :param chunkSize: Number of characters that are read at once
+    """
+    decoder = json.JSONDecoder()
+    buffer = openFile.read(chunkSize)
+    position = 0
+    inArray = False
+
+    while True:
+        # Skip white spaces and separators until the next object starts
+        while position < len(buffer) and buffer[position] in ' \t\n\r,[]':
+            if buffer[position] == '[':
+                inArray = True
+            elif buffer[position] == ']':
+                return
+            position += 1
+
+        if position == len(buffer):
+            buffer = openFile.read(chunkSize)
+            position = 0
+            if not buffer:
+                if inArray:
+                    raise ValueError('Unexpected end of the json array')
+                return
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The object is not complete yet
+            chunk = openFile.read(chunkSize)
+            if not chunk:
+                raise
+            buffer = buffer[position:]+chunk
+            position = 0
+            continue
+
+        yield item
+        position = end
+
+        # Drop the decoded part of the buffer
+        if position > chunkSize:
+            buffer = buffer[position:]
+            position = 0
+
+
+def prepJsonFile(jsonFile, jsonUniqueFile='default-cards-unique.json', chatty=True, stream=False):
+    """
+    :param jsonFile: Path to Scryfall's bulk data json file
+    :param jsonUniqueFile: Path of the output json file with one card per unique name
+    :param stream: If True, the bulk file is parsed incrementally and the unique cards are written
+                   as they are found, so the memory usage does not grow with the size of the bulk file
+    """
+    startTime = time.time()
 
-def prepJsonFile(jsonFile, jsonUniqueFile='default-cards-unique.json', chatty=True):
-    # Load the json file downloaded from scryfall
-    with open(jsonFile) as openFile:
-        scryfallDefault = json.load(openFile)
-    
     # To filter out "Card" and "Token" types (e.g. "The Cities Blessing")
     filterType = ['Card', 'Token']
 
     # The json file contains every card object on Scryfall.
     # Therefore, we need to filter out cards from different expansions that have the same name.
     # Get all unique card names:
-    uniqueNames = []
-    scryfall = []
-    for card in scryfallDefault:
-        if [any(True if tf in card['type_line'] else False for tf in filterType)][0]:
-            # Filters out "Token" and "Card"
-            pass
+    uniqueNames = set()
+    nCards = 0
+    nFiltered = 0
+
+    with open(jsonFile) as openFile, open(jsonUniqueFile, 'w') as outfile:
+        if stream:
+            scryfallDefault = iterJsonArray(openFile)
         else:
-            if card['name'] not in uniqueNames:
-                uniqueNames.append(card['name'])
-                scryfall.append(card)
-    
-    with open(jsonUniqueFile, 'w') as outfile:
-        json.dump(scryfall, outfile)
+            # Load the json file downloaded from scryfall
+            scryfallDefault = json.load(openFile)
+
+        # The unique cards are written as they are found.
+        # The file content is the same as dumping the list of cards
+        outfile.write('[')
+        for card in scryfallDefault:
+            nCards += 1
+            if any(tf in card['type_line'] for tf in filterType):
+                # Filters out "Token" and "Card"
+                nFiltered += 1
+            elif card['name'] not in uniqueNames:
+                if uniqueNames:
+                    outfile.write(', ')
+                uniqueNames.add(card['name'])
+                json.dump(card, outfile)
+        outfile.write(']')
 
     if chatty:
-        outPrint = 'Total number of cards in the Scryfall library: {0}'.format(len(scryfallDefault))
+        outPrint = 'Total number of cards in the Scryfall library: {0}'.format(nCards)
+        outPrint += '\nFiltered "Card" and "Token" types: {0}'.format(nFiltered)
         outPrint += '\nUnique cards: {0}'.format(len(uniqueNames))
+        outPrint += '\nPreparation time: {0:.1f} s'.format(time.time()-startTime)
         print(outPrint)
 
 
+def vectorizeFeatures(combinedFeatures, vocabulary):
+    """ Count matrix of combined feature strings for an existing vocabulary.
+    Unlike CountVectorizer.transform, tokens that are not in the vocabulary
+    are added to it as new columns instead of being ignored.
+
+    :param combinedFeatures: List of combined feature strings
+    :param vocabulary: Dictionary of tokens and their column index. It is extended in place
+
+    Returns (scipy.sparse.csr_matrix) with one column per token of the extended vocabulary
+    """
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    analyzer = CountVectorizer().build_analyzer()
+
+    indptr, indices = [0], []
+    for cardString in combinedFeatures:
+        for token in analyzer(cardString):
+            if token not in vocabulary:
+                vocabulary[token] = len(vocabulary)
+            indices.append(vocabulary[token])
+        indptr.append(len(indices))
+
+    countMatrix = sp.csr_matrix(
+        (np.ones(len(indices), dtype=np.int64), indices, indptr),
+        shape=(len(combinedFeatures), len(vocabulary))
+        )
+    # Duplicate tokens are summed up
+    countMatrix.sum_duplicates()
+    return countMatrix
+
+
 class OmenMachine:
     """
     Class to build a content based recommendation system for Magic cards using scikit-learn.
     Given an existing card, the cosine similarity is used to find the most similar cards.
     Additional filters, for example color identity or legality in various formats can be applied.
     """
+
+    # The relevant features that are combined for every card
+    features = defaultFeatures
+
+    # Data types of the stored similarity scores per mode of runML
+    defaultScoreDtypes = {'dense': 'float64', 'topk': 'float32', 'query': 'float32', 'embedding': 'float32', 'memmap': 'float32', 'ann': 'float32'}
+    scoreDtypes = {
+        'dense': ['float64', 'float32', 'float16'],
+        'topk': ['float32', 'float16'],
+        'memmap': ['float64', 'float32', 'float16', 'uint8'],
+        }
     
-    def __init__(self, jsonUniqueFile, simDfFile, chatty=True):
+    def __init__(self, jsonUniqueFile, simDfFile, chatty=True, cacheSize=0, metrics=None):
         """
         :param jsonUniqueFile: Path to Scryfall's json file after filtering with the prepJsonFile function
         :param simDfFile: Data frame file where similarity information will be stored in/loaded from      
+        :param cacheSize: Number of getSimilarCards results that are cached. 0 disables the cache
+        :param metrics: Metrics that time the stages of loading, building and querying. None disables them
         
         Download options and more information can be found here:
         https://scryfall.com/docs/api/bulk-data
@@ -63,67 +185,66 @@ class OmenMachine:
         self.jsonUniqueFile = jsonUniqueFile
         self.simDfFile = simDfFile
         self.chatty = chatty
+
+        # Similarity information, either as dense data frame or as compact index
+        self.similarCardsDf = None
+        self.similarityIndex = None
+
+        # Least recently used results of getSimilarCards, cleared whenever the similarity changes
+        self.resultCache = ResultCache(cacheSize) if cacheSize else None
+
+        self.metrics = disabledMetrics if metrics is None else metrics
         
         # load the filtered json file
         self._loadFile()
     
     
     def _loadFile(self):
-        # Load the json file downloaded from scryfall
-        with open(self.jsonUniqueFile) as openFile:
-            self.scryfall = json.load(openFile)
-        
-        self.uniqueNames = [card['name'] for card in self.scryfall]
-        
-        # Transform the json input to pandas dataframe. This flattens the dictionary
-        # This causes Flip/Fuse cards etc. to have NaN values in e.g. the "colors" column
-        # because it is stored in "card_faces"
-        self.scryfallDf = json_normalize(self.scryfall)
+        # Load the card information that is used for queries from the metadata cache.
+        # It only keeps the relevant columns, resolves double-faced cards
+        # and contains the encoded card attributes used by the filters of getSimilarCards
+        with self.metrics.timer('load'):
+            self.metadata = CardMetadata.fromJsonFile(self.jsonUniqueFile, chatty=self.chatty)
+        self.cardAttributes = self.metadata.attributes
+
+        self.uniqueNames = self.metadata.names
+        # Index to resolve queried names, including case differences, typos and double-faced names
+        with self.metrics.timer('nameIndex'):
+            self.nameIndex = NameIndex(self.uniqueNames)
+        self.rowIds = self.nameIndex.exactRowIds
+
+        # The full json file is only loaded when it is needed, e.g. to build the features
+        self._scryfall = None
+
+
+    @property
+    def scryfall(self):
+        if self._scryfall is None:
+            # Load the json file downloaded from scryfall
+            with self.metrics.timer('loadJson'), open(self.jsonUniqueFile) as openFile:
+                self._scryfall = json.load(openFile)
+        return self._scryfall
+
+
+    @scryfall.setter
+    def scryfall(self, scryfall):
+        self._scryfall = scryfall
+
+
+    @property
+    def scryfallDf(self):
+        # Data frame with the card information, created from the metadata when it is first used
+        return self.metadata.df
 
     
     def _combineFeatures(self, card):
         """
         :param card: Data frame entry for an individual card on Scryfall
         """
-        try:
-            cardString = ''
-            for feature in self.features:
-                featureString = ''
-                try:
-                    featureString += str(card[feature])
-                except KeyError:
-                    # Cards with "Transform" need to be treated differently.
-                    # Their oracle text is split for the different card_faces,
-                    # e.g. "Delver of Secrets // Insectile Aberration" 
-                    try:
-                        for cf in (0,1):
-                            featureString += card['card_faces'][cf][feature]+' '
-                    except KeyError:  
-                        # One ends up here when the card is for example an Instant
-                        # and one checks for power/toughness keywords.
-                        # Then, an empty string will be passed
-                        # This choice depends on the posed problem
-                        pass
-                
-                # Add feature string to card string
-                cardString += featureString+' '
- 
-        except:
-            if self.chatty:
-                # Print the card properties in case there is an error
-                print(card)
-        
-        # Remove possible description text in parenthesis.
-        # For example: "Cycling—Sacrifice a land. (Sacrifice a land, Discard this card: Draw a card.)"
-        # This will be reduced to: "Cycling—Sacrifice a land."
-        cardString = re.sub(r" ?\([^)]+\)", "", cardString)
-        # Remove additional irrelevant characters from
-        # e.g. Fuse cards like "Wear // Tear"
-        cardString = cardString.replace('//','').replace('—','')
-        return ' '.join(cardString.split()) # Remove multiple white spaces
+        return combineFeatures(card, self.features, self.chatty)
     
     
-    def _prepML(self):
+    def _prepML(self, nJobs=1):
         """
         The relevant input for our machine-learning algorithm are the so-called features.
         These represent the card properties that we use to compare it to other cards.
@@ -132,13 +253,15 @@ class OmenMachine:
         - The converted mana cost
         - The type of the card (e.g., Creature or Instant)
         ...
+
+        :param nJobs: Number of processes that combine the features. None uses all cores
         """
-        
-        # Store the relevant features in a list
-        self.features = ['cmc', 'mana_cost', 'type_line', 'oracle_text', 'power', 'toughness']
-            
+        import pandas as pd
+
         # Combine the features in one string per card
-        combinedFeatures = [self._combineFeatures(card) for card in self.scryfall]
+        combinedFeatures = combineFeaturesParallel(
+            self.scryfall, self.features, nJobs=nJobs, chatty=self.chatty
+            )
         
         # Create a pandas dataframe 
         self.mlDf = pd.DataFrame(np.array([self.uniqueNames]).T)
@@ -149,18 +272,147 @@ class OmenMachine:
             self.mlDf.head()
         
     
-    def runML(self):
+    def runML(self, mode='dense', topK=50, blockSize=1000, scoreDtype=None, nJobs=1, weighting='count',
+              nComponents=128, nLists=None, nProbe=8):
+        """
+        :param mode: "dense" stores the full similarity matrix as data frame.
+                     "topk" only stores the topK most similar cards per card in a compact index,
+                     which is computed blockwise so the full matrix never exists in memory.
+                     "query" does not precompute any similarity. The normalized count matrix is kept
+                     and the similarity is computed when a card is queried.
+                     "memmap" writes the full similarity matrix blockwise to a raw array file
+                     next to a json name index, which loadML memory-maps.
+                     "embedding" keeps dense vectors of nComponents dimensions per card, which are
+                     reduced from the count matrix with a truncated SVD. Queries are dense dot products.
+                     "ann" builds an approximate nearest-neighbour index (IVFIndex) for catalogs
+                     that are too large for the exact similarity, e.g. every printing of every card
+        :param topK: Number of similar cards that are kept per card in "topk" mode
+        :param blockSize: Number of cards whose similarity is computed at once in "dense", "topk" and "memmap" mode.
+                          The peak memory of the computation grows with blockSize times nJobs
+        :param scoreDtype: Data type of the stored scores. None uses float64 in "dense" mode and float32 otherwise.
+                           "dense" also supports "float32" and "float16", "topk" supports "float16" and
+                           "memmap" supports "float64", "float16" and "uint8", which quantizes the scores to 1/255.
+                           Other data types raise a ValueError (see OmenMachine.scoreDtypes).
+                           Not used in "query", "embedding" and "ann" mode, which store no scores
+        :param nJobs: Number of processes that prepare the features and of threads that compute
+                      the similarity blocks in "dense", "topk" and "memmap" mode. None uses all cores
+        :param weighting: Weighting of the token counts: "count" (raw counts), "tfidf",
+                          "sublinear" (tf-idf with logarithmic counts) or "bm25"
+        :param nComponents: Number of dimensions of the reduced vectors in "embedding" and "ann" mode
+        :param nLists: Number of clusters of the "ann" index. None uses sqrt(N)
+        :param nProbe: Number of clusters that an "ann" query visits. More clusters increase
+                       the recall and the query time. It can be changed later with similarityIndex.nProbe
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        if mode not in ('dense', 'topk', 'query', 'embedding', 'memmap', 'ann'):
+            raise ValueError('Unknown mode {0}. Choose "dense", "topk", "query", "embedding", "memmap" or "ann".'.format(mode))
+
+        if scoreDtype is None:
+            scoreDtype = self.defaultScoreDtypes[mode]
+        if mode in self.scoreDtypes and np.dtype(scoreDtype).name not in self.scoreDtypes[mode]:
+            raise ValueError('scoreDtype {0} is not supported in {1} mode. Choose one of {2}.'.format(
+                scoreDtype, mode, ', '.join(self.scoreDtypes[mode])))
+
+        featureWeighting = FeatureWeighting(weighting)
+
+        self.clearResultCache()
+
         # Prepare features
-        self._prepML()
+        with self.metrics.timer('prepFeatures'):
+            self._prepML(nJobs=nJobs)
         
         # Create count matrix from the combined feature column
-        cv = CountVectorizer()
-        countMatrix = cv.fit_transform(self.mlDf['CombinedFeatures'])
+        with self.metrics.timer('vectorize', weighting=weighting):
+            cv = CountVectorizer()
+            countMatrix = featureWeighting.fitTransform(cv.fit_transform(self.mlDf['CombinedFeatures']))
+
+        # Keep the vocabulary and the features for incremental updates
+        with self.metrics.timer('saveFeatures'):
+            self._saveFeatures(
+                {token: int(column) for token, column in cv.vocabulary_.items()},
+                normalizeRows(countMatrix),
+                list(self.mlDf['CombinedFeatures']),
+                featureWeighting
+                )
+
+        with self.metrics.timer('similarity', mode=mode):
+            self._buildSimilarity(mode, countMatrix, topK, blockSize, scoreDtype, nJobs, nComponents, nLists, nProbe)
+
+
+    def _buildSimilarity(self, mode, countMatrix, topK, blockSize, scoreDtype, nJobs, nComponents, nLists, nProbe):
+        """ Compute and store the similarity information of a runML mode from the weighted count matrix """
+        import joblib
+        import pandas as pd
+
+
+        if mode == 'topk':
+            self.similarCardsDf = None
+            self.similarityIndex = TopKIndex.fromCountMatrix(
+                self.uniqueNames, countMatrix, topK=topK, blockSize=blockSize, dtype=scoreDtype, nJobs=nJobs
+                )
+
+            if self.chatty:
+                print('Stored the {0} most similar cards for {1} cards'.format(
+                    self.similarityIndex.topK, len(self.similarityIndex)))
+
+            # Dump it in a file
+            joblib.dump(self.similarityIndex, self.simDfFile)
+            return
+
+        if mode == 'query':
+            self.similarCardsDf = None
+            self.similarityIndex = QueryIndex.fromCountMatrix(self.uniqueNames, countMatrix)
+
+            if self.chatty:
+                print('Stored the count matrix with {0} features for {1} cards'.format(
+                    self.similarityIndex.featureMatrix.shape[1], len(self.similarityIndex)))
+
+            joblib.dump(self.similarityIndex, self.simDfFile)
+            return
+
+        if mode == 'embedding':
+            self.similarCardsDf = None
+            self.similarityIndex = EmbeddingIndex.fromCountMatrix(self.uniqueNames, countMatrix, nComponents=nComponents)
+
+            if self.chatty:
+                print('Stored {0} dimensional vectors for {1} cards'.format(
+                    self.similarityIndex.nComponents, len(self.similarityIndex)))
+
+            joblib.dump(self.similarityIndex, self.simDfFile)
+            return
+
+        if mode == 'ann':
+            self.similarCardsDf = None
+            self.similarityIndex = IVFIndex.fromCountMatrix(
+                self.uniqueNames, countMatrix, nComponents=nComponents, nLists=nLists, nProbe=nProbe
+                )
 
-        # Compute the cosine similarity based on the count matrix
-        cosineSim = cosine_similarity(countMatrix)
+            if self.chatty:
+                print('Clustered {0} cards into {1} lists'.format(len(self.similarityIndex), self.similarityIndex.nLists))
+
+            joblib.dump(self.similarityIndex, self.simDfFile)
+            return
+
+        if mode == 'memmap':
+            self.similarCardsDf = None
+            self.similarityIndex = MemmapIndex.create(
+                self.simDfFile, self.uniqueNames, countMatrix, dtype=scoreDtype, blockSize=blockSize, nJobs=nJobs
+                )
+
+            if self.chatty:
+                print('Stored the similarity of {0} cards in {1}'.format(
+                    len(self.similarityIndex), MemmapIndex.arrayFile(self.simDfFile)))
+            return
+
+        # Compute the cosine similarity based on the count matrix.
+        # The matrix is filled blockwise, so there are no intermediate copies of its size
+        cosineSim = np.empty((len(self.uniqueNames), len(self.uniqueNames)), dtype=scoreDtype)
+        for start, stop, block in blockCosineSimilarity(countMatrix, blockSize, nJobs):
+            cosineSim[start:stop] = block
         
         # Store the similarity in dataframe
+        self.similarityIndex = None
         self.similarCardsDf = pd.DataFrame(cosineSim, index=self.uniqueNames, columns=self.uniqueNames)
         
         if self.chatty:
@@ -171,113 +423,479 @@ class OmenMachine:
     
     
     def loadML(self):
-        # Load the pandas dataframe in which the similarity is stored as a correlation matrix
-        self.similarCardsDf = joblib.load(self.simDfFile)
+        self.clearResultCache()
+
+        with self.metrics.timer('loadML'):
+            self._loadSimilarity()
+
+
+    def _checkNames(self, names, fileName):
+        """ Raise an error if a file was built from other cards than the ones in jsonUniqueFile.
+        The rows of the similarity information are looked up by position, so the names have to be equal
+
+        :param names: Card names in the order in which they are stored in the file
+        :param fileName: Path of the file, for the error message
+        """
+        if list(names) != list(self.uniqueNames):
+            raise RuntimeError(
+                '{0} was built from other cards than {1}. Run runML to build it again.'.format(
+                    fileName, self.jsonUniqueFile))
+
+
+    def _loadSimilarity(self):
+
+        if MemmapIndex.isIndexFile(self.simDfFile):
+            # The similarity matrix stays on disk and is memory-mapped
+            similarityIndex = MemmapIndex.load(self.simDfFile)
+            self._checkNames(similarityIndex.names, self.simDfFile)
+            self.similarCardsDf = None
+            self.similarityIndex = similarityIndex
+            return
+
+        # Load the similarity information. This is either the pandas dataframe
+        # in which the similarity is stored as a correlation matrix or a compact index
+        import joblib
+        similarity = joblib.load(self.simDfFile)
+
+        # A data frame can only be loaded if pandas was imported by unpickling it
+        pd = sys.modules.get('pandas')
+        if pd is not None and isinstance(similarity, pd.DataFrame):
+            self._checkNames(similarity.index, self.simDfFile)
+            self.similarCardsDf = similarity
+            self.similarityIndex = None
+        else:
+            self._checkNames(similarity.names, self.simDfFile)
+            self.similarCardsDf = None
+            self.similarityIndex = similarity
+
+
+    @property
+    def featuresFile(self):
+        # File next to the similarity information, in which the features are stored
+        return self.simDfFile+'.features'
+
+
+    def _saveFeatures(self, vocabulary, featureMatrix, combinedFeatures, featureWeighting):
+        """
+        :param vocabulary: Dictionary of tokens and their column in the count matrix
+        :param featureMatrix: L2-normalized sparse (weighted) count matrix with one row per card
+        :param combinedFeatures: List of the combined feature strings of all cards
+        :param featureWeighting: FeatureWeighting that was applied to the counts
+        """
+        import joblib
+        joblib.dump({
+            'names': list(self.uniqueNames),
+            'vocabulary': vocabulary,
+            'featureMatrix': featureMatrix,
+            'combinedFeatures': combinedFeatures,
+            'weighting': featureWeighting,
+            }, self.featuresFile)
+
+
+    def update(self, jsonFile, blockSize=1000):
+        """ Update the cards and the similarity information with a new Scryfall bulk file,
+        e.g. after a new set was released, without rebuilding everything.
+
+        Only the added cards and the cards whose features changed are vectorized with the
+        existing vocabulary, which is extended by new tokens. Only the similarity information
+        of these cards (and the neighbour lists that contain them) is computed again.
+        New cards are appended, so the row ids of the existing cards stay the same.
+        Cards that are missing in the new bulk file are kept.
+
+        :param jsonFile: Path to Scryfall's new bulk data json file
+        :param blockSize: Number of cards whose similarity is computed at once
+        """
+        import joblib
+        import pandas as pd
+        import scipy.sparse as sp
+
+        if self.similarCardsDf is None and self.similarityIndex is None:
+            raise RuntimeError('Run runML or loadML before updating.')
+        if not os.path.isfile(self.featuresFile):
+            raise RuntimeError('{0} is missing. Run runML to store the features.'.format(self.featuresFile))
+
+        self.clearResultCache()
+
+        startTime = time.time()
+        stored = joblib.load(self.featuresFile)
+        self._checkNames(stored['names'], self.featuresFile)
+        vocabulary = stored['vocabulary']
+        # Feature files of older versions only contain raw counts
+        featureWeighting = stored.get('weighting') or FeatureWeighting('count')
+
+        # Filter the new bulk file in the same way as the current one
+        uniqueFile = self.jsonUniqueFile+'.update'
+        prepJsonFile(jsonFile, uniqueFile, chatty=self.chatty, stream=True)
+        with open(uniqueFile) as openFile:
+            newCards = {card['name']: card for card in json.load(openFile)}
+        os.remove(uniqueFile)
+
+        # Existing cards get their new version (e.g. with changed legalities), new cards are appended
+        nOld = len(self.scryfall)
+        scryfall = [newCards.pop(card['name'], card) for card in self.scryfall]
+        scryfall += list(newCards.values())
+
+        combinedFeatures = list(stored['combinedFeatures'])
+        combinedFeatures += [None]*(len(scryfall)-nOld)
+        affectedIds = []
+        for rowId, card in enumerate(scryfall):
+            cardString = self._combineFeatures(card)
+            if cardString != combinedFeatures[rowId]:
+                combinedFeatures[rowId] = cardString
+                affectedIds.append(rowId)
+        affectedIds = np.array(affectedIds, dtype=np.intp)
+
+        # Vectorize the affected cards and extend the vocabulary by new tokens
+        nTokens = len(vocabulary)
+        affectedMatrix = vectorizeFeatures([combinedFeatures[rowId] for rowId in affectedIds], vocabulary)
+        affectedMatrix = normalizeRows(featureWeighting.extend(affectedMatrix).transform(affectedMatrix))
+
+        # The existing cards do not contain the new tokens
+        featureMatrix = stored['featureMatrix'].tocsr()
+        featureMatrix.resize((nOld, len(vocabulary)))
+
+        # Replace the rows of the changed cards and append the new cards
+        rowOrder = np.arange(len(scryfall))
+        rowOrder[affectedIds] = nOld+np.arange(len(affectedIds))
+        featureMatrix = sp.vstack([featureMatrix, affectedMatrix]).tocsr()[rowOrder]
+
+        self.scryfall = scryfall
+        self.uniqueNames = [card['name'] for card in self.scryfall]
+
+        if self.similarCardsDf is not None:
+            # Dense similarity matrix: rows and columns of the affected cards are computed again
+            values = np.zeros((len(scryfall), len(scryfall)), dtype=self.similarCardsDf.values.dtype)
+            values[:nOld, :nOld] = self.similarCardsDf.values
+            transposed = featureMatrix.T.tocsc()
+            for start in range(0, len(affectedIds), blockSize):
+                rows = affectedIds[start:start+blockSize]
+                block = (featureMatrix[rows] @ transposed).toarray()
+                values[rows] = block
+                values[:, rows] = block.T
+            self.similarCardsDf = pd.DataFrame(values, index=self.uniqueNames, columns=self.uniqueNames)
+            joblib.dump(self.similarCardsDf, self.simDfFile)
+        else:
+            self.similarityIndex.update(self.uniqueNames, featureMatrix, affectedIds, blockSize=blockSize)
+            if not isinstance(self.similarityIndex, MemmapIndex):
+                joblib.dump(self.similarityIndex, self.simDfFile)
+
+        self._saveFeatures(vocabulary, featureMatrix, combinedFeatures, featureWeighting)
+
+        # Store the updated cards and reload them
+        with open(self.jsonUniqueFile, 'w') as outfile:
+            json.dump(self.scryfall, outfile)
+        self._loadFile()
+
+        if self.chatty:
+            outPrint = 'Added cards: {0}'.format(len(scryfall)-nOld)
+            outPrint += '\nChanged cards: {0}'.format(int(np.sum(affectedIds < nOld)))
+            outPrint += '\nNew tokens: {0}'.format(len(vocabulary)-nTokens)
+            outPrint += '\nUpdate time: {0:.1f} s'.format(time.time()-startTime)
+            print(outPrint)
+
+        self.metrics.observe('update', time.time()-startTime)
+        self.metrics.count('updatedCards', len(affectedIds))
+
+
+    def clearResultCache(self):
+        """ Remove all cached results. runML, loadML and update call it, because they replace the similarity """
+        if self.resultCache is not None:
+            self.resultCache.clear()
+
+
+    @property
+    def cacheStats(self):
+        """ Hits, misses and size of the result cache, or None if the cache is disabled """
+        if self.resultCache is None:
+            return None
+        return self.resultCache.stats
+
+
+    def _resolveCard(self, magicCard):
+        """ Row id of a queried card name. Case differences, typos and the name of one face
+        of a double-faced card are resolved to the most similar card name.
+
+        :param magicCard: String of the card name to be queried
+
+        Returns (int) row id, or None if the card is not in the database
+        """
+        rowId = self.nameIndex.resolve(magicCard)
+
+        if rowId is None:
+            print('Magic card {0} is not in the database.'.format(magicCard))
+            suggestions = self.nameIndex.suggest(magicCard, number=3)
+            if suggestions:
+                print('Did you mean: {0}?'.format(', '.join(name for name, _ in suggestions)))
+        elif self.chatty and self.uniqueNames[rowId] != magicCard:
+            print('Magic card {0} is resolved to {1}.'.format(magicCard, self.uniqueNames[rowId]))
+
+        return rowId
+
+
+    def _searchSimilarCards(self, rowId, queryNumber, **filters):
+        """ Most similar cards that pass the filters
+
+        :param rowId: Row id of the queried card
+        :param queryNumber: Number of returned cards
+        :param filters: Filter keywords of getSimilarCards
+
+        Returns (np.ndarray), (np.ndarray): row ids and similarity scores sorted by decreasing score
+        """
+        def filterMask(rowIds):
+            return self.cardAttributes.mask(rowIds=rowIds, metrics=self.metrics, **filters)
+
+        if self.similarCardsDf is not None:
+            return searchScores(self.similarCardsDf.values[:, rowId], rowId, filterMask, queryNumber)
+
+        if hasattr(self.similarityIndex, 'rowScores'):
+            return searchScores(self.similarityIndex.rowScores(rowId), rowId, filterMask, queryNumber)
+
+        # The compact index only knows the neighbours of the card
+        similarIds, simValues = self.similarityIndex.query(rowId)
+        mask = filterMask(similarIds)
+        return similarIds[mask][:queryNumber], simValues[mask][:queryNumber]
+
+
+    def _resultDf(self, rowIds, simValues):
+        """ Data frame with the Scryfall information of the given cards and their similarity """
+        resultDf = self.metadata.toDataFrame(rowIds)
+        resultDf.insert(0, 'sim_value', simValues)
+        # Same column order as merging the similarity with the Scryfall data frame
+        columns = ['name', 'sim_value'] + [column for column in resultDf.columns if column not in ('name', 'sim_value')]
+        return resultDf[columns]
 
         
     def getSimilarCards(self, magicCard,
                         cmcFilter='>=0',
                         colorFilter = None,
-                        commanderFilter = ['W', 'U', 'B', 'R', 'G', 'C'],
-                        typeFilter = ['Artifact', 'Conspiracy', 'Creature', 'Emblem',
-                                      'Enchantment', 'Hero', 'Instant', 'Land',
-                                      'Phenomenon', 'Plane ', 'Planeswalker', 'Scheme',
-                                      'Sorcery', 'Tribal', 'Vanguard'],
-                        rarityFilter = ['common', 'mythic', 'rare', 'uncommon'],
+                        commanderFilter = allColors,
+                        typeFilter = defaultTypes,
+                        rarityFilter = defaultRarities,
                         legalityFilter = None,
                         queryNumber=10):
     
         """ Function to return most similar cards
         
         :param magicCard: String of the card name to be queried
-        :param cmcFilter: 
-        :param colorFilter: 
-        :param commanderFilter: 
-        :param typeFilter: 
-        :param rarityFilter: 
-        :param legalityFilter:
+        :param cmcFilter: Comparison with the converted mana cost, e.g. ">=0" or "<3"
+        :param colorFilter: List of colors that a card has to contain
+        :param commanderFilter: List of colors in which the color identity has to be
+        :param typeFilter: List of card types of which a card has to have any
+        :param rarityFilter: List of allowed rarities
+        :param legalityFilter: Format or list of formats in which a card has to be legal
         :param queryNumber: Defines how many card suggestions are returned
     
-        Returns (list), (list)
+        Returns (pd.DataFrame): The queried card followed by the most similar cards
         """
+        import pandas as pd
+
+        filters = dict(
+            cmcFilter=cmcFilter,
+            colorFilter=colorFilter,
+            commanderFilter=commanderFilter,
+            typeFilter=typeFilter,
+            rarityFilter=rarityFilter,
+            legalityFilter=legalityFilter
+            )
+
+        startTime = time.perf_counter()
+
+        if self.resultCache is not None:
+            key = queryKey(magicCard, queryNumber, **filters)
+            resultDf = self.resultCache.get(key)
+            if resultDf is not None:
+                if self.chatty:
+                    self._printResult(resultDf.iloc[:1], resultDf.iloc[1:].reset_index(drop=True))
+                self.metrics.observe('query', time.perf_counter()-startTime, cache='hit')
+                # A copy, so changes by the caller do not end up in the cache
+                return resultDf.copy()
         
-        if magicCard not in self.uniqueNames:
-            print('Magic card {0} is not in the database.'.format(magicCard))
+        with self.metrics.timer('resolve'):
+            rowId = self._resolveCard(magicCard)
+        if rowId is None:
+            self.metrics.count('unknownCards')
             return -1
 
-        similarityValues = self.similarCardsDf[magicCard].sort_values(ascending=False)    
-        similarityValues = similarityValues.to_frame().reset_index()
-        # Name the data frame columns to merge it
-        similarityValues.columns = ['name', 'sim_value']
-        
-        # Merge the data frames
-        similarityDf = pd.merge(similarityValues, self.scryfallDf, on='name')
-        
-        # Filter out the input Magic card
-        magicCardDf = similarityDf[similarityDf.name == magicCard]
-        similarityDf = similarityDf[similarityDf.name != magicCard]
-        
+        # Walk the cards by decreasing similarity until enough of them pass the filters
+        with self.metrics.timer('search'):
+            similarIds, simValues = self._searchSimilarCards(rowId, queryNumber, **filters)
+
+        with self.metrics.timer('resultDf'):
+            magicCardDf = self._resultDf([rowId], [1.])
+
+            if len(similarIds)==0:
+                # When there is nothing left, e.g. when filters are too strict
+                resultDf = magicCardDf
+                similarityDf = magicCardDf.iloc[:0]
+            else:
+                similarityDf = self._resultDf(similarIds, simValues)
+                # Combine the two data frames
+                resultDf = pd.concat([magicCardDf, similarityDf], ignore_index=True)
+
+        if self.chatty:
+            self._printResult(magicCardDf, similarityDf)
+
+        if self.resultCache is not None:
+            self.resultCache.put(key, resultDf.copy())
+
+        self.metrics.observe('query', time.perf_counter()-startTime,
+                             cache='disabled' if self.resultCache is None else 'miss')
+        return resultDf
+
+
+    @staticmethod
+    def _printResult(magicCardDf, similarityDf):
+        # Define output parameters that will be printed 
         outParams = ['name', 'sim_value', 'type_line', 'mana_cost', 'color_identity']
+        print(magicCardDf[outParams])
+        if len(similarityDf):
+            print('')
+            print(similarityDf[outParams])
 
-        try:
-            # Filter data frame according to "converted mana cost"
-            similarityDf = similarityDf.query('cmc{0}'.format(cmcFilter))
 
-            # Filter data frame according to card type
-            similarityDf = similarityDf[
-                [any(True if tf in tv else False for tf in typeFilter) for tv in similarityDf.type_line.values]
-                ]
-            
-            # Filter data frame according to rarity
-            similarityDf = similarityDf[
-                [any(True if rf == rv else False for rf in rarityFilter) for rv in similarityDf.rarity.values]
-                ]
-                    
-            # Filter data frame according to containing all colors in "colorFilter"
-            # e.g. [G,R] will show Gruul cards but for example also [W,G,R].
-            if colorFilter is not None:     
-                mask = []
-                for index in range(len(similarityDf)):
-                    cv = similarityDf.iloc[index].colors
-                    if str(cv) == 'nan':
-                        cv = similarityDf.iloc[index].card_faces[0]['colors']
-                        if len(cv)==0:
-                            cv = ['C']
-                    mask.append( all(True if cf in cv else False for cf in colorFilter) )
-                similarityDf = similarityDf[mask]
-            
-            # Filter data frame according to commanders’ color identity
-            allColors = np.array(['W', 'U', 'B', 'R', 'G', 'C'])
-            antiCommanderFilter = allColors[ np.invert([any(cf in ac for cf in commanderFilter) for ac in allColors]) ]
+    def getSimilarCardsBatch(self, magicCards,
+                             cmcFilter='>=0',
+                             colorFilter = None,
+                             commanderFilter = allColors,
+                             typeFilter = defaultTypes,
+                             rarityFilter = defaultRarities,
+                             legalityFilter = None,
+                             queryNumber=10,
+                             batchSize=256):
 
-            similarityDf = similarityDf[
-                [all(False if ci in antiCommanderFilter else True for ci in cis) for cis in similarityDf.color_identity]
-                ]
-            
-            # Filter data frame according to legality in different formats
-            if legalityFilter is not None:
-                similarityDf = similarityDf[
-                    [all(False if similarityDf['legalities.{0}'.format(lf)].iloc[index]=='not_legal' else True for lf in np.atleast_1d(legalityFilter)) for index in range(len(similarityDf))]
-                    ]
-        except AttributeError:
-            # When Filters are too strict, e.g. CMC < 0 (which does not exist)
-            if self.chatty:
-                print(magicCardDf[outParams])
-            return magicCardDf 
+        """ Function to return the most similar cards for many cards at once.
+        The filters are shared by all queried cards and evaluated only once.
+        The similarity of batchSize cards is computed at once, e.g. as one sparse matrix product.
 
-        similarityDf = similarityDf[:queryNumber]
+        :param magicCards: List of card names to be queried
+        :param batchSize: Number of cards whose similarity is computed at once
+        The other parameters are the same as for getSimilarCards
+
+        Returns (pd.DataFrame) with the columns "magic_card", "rank", "name" and "sim_value",
+        which holds the queryNumber most similar cards per queried card
+        """
+        import pandas as pd
+
+        startTime = time.perf_counter()
+
+        rowIds = []
+        with self.metrics.timer('resolve', kind='batch'):
+            for magicCard in magicCards:
+                rowId = self._resolveCard(magicCard)
+                if rowId is not None:
+                    rowIds.append(rowId)
+        rowIds = np.array(rowIds, dtype=np.intp)
+
+        # Filter mask of all cards, shared by all queried cards
+        mask = self.cardAttributes.mask(
+            cmcFilter=cmcFilter,
+            colorFilter=colorFilter,
+            commanderFilter=commanderFilter,
+            typeFilter=typeFilter,
+            rarityFilter=rarityFilter,
+            legalityFilter=legalityFilter,
+            metrics=self.metrics
+            )
+
+        queries, similarIds, simValues = [], [], []
+        for start in range(0, len(rowIds), batchSize):
+            batchIds = rowIds[start:start+batchSize]
+
+            with self.metrics.timer('batchScores'):
+                if self.similarCardsDf is not None:
+                    scores = self.similarCardsDf.values[batchIds]
+                else:
+                    scores = self.similarityIndex.batchScores(batchIds)
+
+            # Exclude filtered cards and the queried cards themselves
+            scores[:, ~mask] = -np.inf
+            scores[np.arange(len(batchIds)), batchIds] = -np.inf
+
+            with self.metrics.timer('search', kind='batch'):
+                batchQueries, batchSimilarIds, batchSimValues = searchScoresBatch(scores, queryNumber)
+            queries.append(batchQueries+start)
+            similarIds.append(batchSimilarIds)
+            simValues.append(batchSimValues)
+
+        queries = np.concatenate(queries) if queries else np.array([], dtype=np.intp)
+        similarIds = np.concatenate(similarIds) if similarIds else np.array([], dtype=np.intp)
+        simValues = np.concatenate(simValues) if simValues else np.array([])
+
+        # Rank of each card within its queried card, starting at 1
+        firstPositions = np.searchsorted(queries, queries)
+        ranks = np.arange(len(queries))-firstPositions+1
+
+        uniqueNames = np.array(self.uniqueNames, dtype=object)
+        resultDf = pd.DataFrame({
+            'magic_card': uniqueNames[rowIds[queries]],
+            'rank': ranks,
+            'name': uniqueNames[similarIds],
+            'sim_value': simValues,
+            })
+
+        self.metrics.observe('batchQuery', time.perf_counter()-startTime)
+        self.metrics.count('batchCards', len(rowIds))
+        return resultDf
+
+
+    def getDeckRecommendations(self, decklist,
+                               cmcFilter='>=0',
+                               colorFilter = None,
+                               commanderFilter = allColors,
+                               typeFilter = defaultTypes,
+                               rarityFilter = defaultRarities,
+                               legalityFilter = None,
+                               queryNumber=10):
+
+        """ Function to return the cards that are most similar to a whole deck.
+        The deck is represented by the centroid of its cards weighted by their counts.
+        Cards that are already in the deck are not suggested.
+
+        :param decklist: Dictionary of card names and their counts, e.g. {'Omen Machine': 1, 'Island': 20}.
+                         A list of card names counts every card once
+        The other parameters are the same as for getSimilarCards
+
+        Returns (pd.DataFrame): The suggested cards sorted by decreasing similarity
+        """
+        if not isinstance(decklist, dict):
+            decklist = {magicCard: 1 for magicCard in decklist}
+
+        rowIds, weights = [], []
+        for magicCard, count in decklist.items():
+            rowId = self._resolveCard(magicCard)
+            if rowId is not None:
+                rowIds.append(rowId)
+                weights.append(count)
+
+        if len(rowIds) == 0:
+            return -1
+        rowIds = np.array(rowIds, dtype=np.intp)
+
+        if self.similarCardsDf is not None:
+            scores = centroidScores(self.similarCardsDf.values[rowIds], rowIds, weights)
+        else:
+            scores = self.similarityIndex.centroidScores(rowIds, weights)
+
+        def filterMask(candidates):
+            return self.cardAttributes.mask(
+                cmcFilter=cmcFilter,
+                colorFilter=colorFilter,
+                commanderFilter=commanderFilter,
+                typeFilter=typeFilter,
+                rarityFilter=rarityFilter,
+                legalityFilter=legalityFilter,
+                rowIds=candidates,
+                metrics=self.metrics
+                )
+
+        # The cards of the deck are excluded from the suggestions
+        with self.metrics.timer('search', kind='deck'):
+            similarIds, simValues = searchScores(scores, rowIds, filterMask, queryNumber)
+        with self.metrics.timer('resultDf', kind='deck'):
+            similarityDf = self._resultDf(similarIds, simValues)
 
-        if len(similarityDf)==0:
-            # When there is nothing left
-            if self.chatty:
-                print(magicCardDf[outParams])
-            return magicCardDf 
-        
         if self.chatty:
-            # Define output parameters that will be printed 
-            print(magicCardDf[outParams])
-            print('')
+            outParams = ['name', 'sim_value', 'type_line', 'mana_cost', 'color_identity']
             print(similarityDf[outParams])
 
-        # Combine the two data frames
-        return pd.concat([magicCardDf, similarityDf])
+        return similarityDf
@@ -0,0 +1,327 @@
+# coding: utf-8
+
+""" Command-line interface of OmenMachine
+
+    python -m omenmachine prep default-cards.json default-cards-unique.json
+    python -m omenmachine build default-cards-unique.json SimilarCardsDf --mode topk --jobs 4 --memory-limit 2000
+    python -m omenmachine query default-cards-unique.json SimilarCardsDf "Omen Machine" --colors U --legality modern
+    python -m omenmachine batch default-cards-unique.json SimilarCardsDf --input names.txt --output similar.jsonl
+    python -m omenmachine export default-cards-unique.json SimilarCardsDf neighbours.parquet --top-k 50 --jobs 4
+
+The filters of getSimilarCards are available as --cmc, --colors, --commander, --types, --rarities
+and --legality in the query, batch and export commands.
+"""
+
+import os
+import sys
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .card_recommendation import OmenMachine, prepJsonFile
+
+
+# Options of the filters and the keyword of getSimilarCards they set
+filterOptions = {
+    'cmc': 'cmcFilter',
+    'colors': 'colorFilter',
+    'commander': 'commanderFilter',
+    'types': 'typeFilter',
+    'rarities': 'rarityFilter',
+    'legality': 'legalityFilter',
+    }
+
+# Columns of the printed query results, as in the output of getSimilarCards with chatty=True
+outputColumns = ['name', 'sim_value', 'type_line', 'mana_cost', 'color_identity']
+
+
+def _addFilterArguments(parser):
+    group = parser.add_argument_group('filters')
+    group.add_argument('--cmc', help='Comparison with the converted mana cost, e.g. "<=3"')
+    group.add_argument('--colors', nargs='+', help='Colors that a card has to contain, e.g. G R')
+    group.add_argument('--commander', nargs='+', help='Colors of the commander, which contain the color identity')
+    group.add_argument('--types', nargs='+', help='Card types of which a card has to have any')
+    group.add_argument('--rarities', nargs='+', help='Allowed rarities')
+    group.add_argument('--legality', nargs='+', help='Formats in which a card has to be legal')
+
+
+def _filters(args):
+    """ Keywords of getSimilarCards for the filters that were given. The others keep their defaults """
+    return {keyword: getattr(args, option) for option, keyword in filterOptions.items()
+            if getattr(args, option) is not None}
+
+
+def _loadModel(args):
+    om = OmenMachine(args.jsonUniqueFile, args.simDfFile, chatty=False)
+    om.loadML()
+    return om
+
+
+def blockSizeForMemory(nCards, memoryLimit, nJobs=1, mode='dense', scoreDtype='float64'):
+    """ Largest block size of runML whose similarity blocks fit into a memory limit
+
+    Every block of rows is computed as a sparse product and converted to a dense float64 array,
+    and up to nJobs+1 blocks exist at once. In "dense" mode the stored matrix is added on top.
+
+    :param nCards: Number of cards
+    :param memoryLimit: Memory limit in MB
+    :param nJobs: Number of threads that compute blocks
+    :param mode: Mode of runML
+    :param scoreDtype: Data type of the stored scores in "dense" mode
+
+    Returns (int) block size
+    """
+    available = memoryLimit*2**20
+    if mode == 'dense':
+        available -= nCards*nCards*np.dtype(scoreDtype).itemsize
+        if available <= 0:
+            raise ValueError('The dense similarity of {0} cards needs {1:.0f} MB, more than the limit of {2} MB. '
+                             'Use the "topk", "memmap" or "query" mode.'.format(
+                                 nCards, nCards*nCards*np.dtype(scoreDtype).itemsize/2**20, memoryLimit))
+
+    bytesPerRow = 2*8*max(nCards, 1)
+    return int(max(1, min(nCards, available//(bytesPerRow*(nJobs+1)))))
+
+
+def prep(args):
+    prepJsonFile(args.jsonFile, args.jsonUniqueFile, chatty=not args.quiet, stream=args.stream)
+
+
+def build(args):
+    om = OmenMachine(args.jsonUniqueFile, args.simDfFile, chatty=not args.quiet)
+    nJobs = args.jobs if args.jobs > 0 else None
+
+    blockSize = args.block_size
+    if args.memory_limit is not None:
+        scoreDtype = args.score_dtype or OmenMachine.defaultScoreDtypes[args.mode]
+        limitBlockSize = blockSizeForMemory(len(om.uniqueNames), args.memory_limit, nJobs or os.cpu_count() or 1,
+                                            args.mode, scoreDtype)
+        blockSize = min(blockSize, limitBlockSize)
+        if not args.quiet:
+            print('Block size {0} for a memory limit of {1} MB'.format(blockSize, args.memory_limit))
+
+    om.runML(mode=args.mode, topK=args.top_k, blockSize=blockSize, scoreDtype=args.score_dtype, nJobs=nJobs,
+             weighting=args.weighting, nComponents=args.components, nLists=args.lists, nProbe=args.probe)
+
+
+def _printRecords(df):
+    """ Rows of a data frame as json lines on stdout """
+    text = df.to_json(orient='records', lines=True, force_ascii=False)
+    sys.stdout.write(text if text.endswith('\n') or not text else text+'\n')
+
+
+def query(args):
+    om = _loadModel(args)
+    result = om.getSimilarCards(args.card, queryNumber=args.number, **_filters(args))
+    if isinstance(result, int):
+        # The card is not in the database
+        return 1
+
+    if args.json:
+        _printRecords(result)
+    else:
+        print(result[outputColumns].to_string())
+
+
+def _readNames(inputFile):
+    openFile = sys.stdin if inputFile in (None, '-') else open(inputFile, encoding='utf-8')
+    try:
+        return [line.strip() for line in openFile if line.strip()]
+    finally:
+        if openFile is not sys.stdin:
+            openFile.close()
+
+
+def batch(args):
+    om = _loadModel(args)
+    names = list(args.cards) + (_readNames(args.input) if args.input or not args.cards else [])
+    result = om.getSimilarCardsBatch(names, queryNumber=args.number, **_filters(args))
+
+    if args.output in (None, '-'):
+        _printRecords(result)
+    elif args.output.endswith('.csv'):
+        result.to_csv(args.output, index=False)
+    else:
+        with _openWriter(args.output, args.format) as writer:
+            writer.write(result)
+
+
+class JsonLinesWriter:
+    """ Writes data frames as one json object per row """
+
+    def __init__(self, outputFile):
+        self.outfile = open(outputFile, 'w', encoding='utf-8')
+
+
+    def write(self, df):
+        if len(df):
+            text = df.to_json(orient='records', lines=True, force_ascii=False)
+            self.outfile.write(text if text.endswith('\n') else text+'\n')
+
+
+    def close(self):
+        self.outfile.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetWriter(JsonLinesWriter):
+    """ Writes data frames as row groups of one Parquet file. Needs pyarrow """
+
+    def __init__(self, outputFile):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError('The Parquet export needs pyarrow. Install it or export to .jsonl.')
+        self.pyarrow = pyarrow
+        self.outputFile = outputFile
+        self.writer = None
+
+
+    def write(self, df):
+        table = self.pyarrow.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.outputFile, table.schema)
+        self.writer.write_table(table)
+
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _openWriter(outputFile, outputFormat=None):
+    """ Writer for the output format, which is guessed from the file extension if it is None """
+    if outputFormat is None:
+        outputFormat = 'parquet' if outputFile.endswith('.parquet') else 'jsonl'
+    if outputFormat == 'parquet':
+        return ParquetWriter(outputFile)
+    return JsonLinesWriter(outputFile)
+
+
+def exportNeighbours(om, writer, topK=50, chunkSize=1000, nJobs=1, **filters):
+    """ Write the topK most similar cards of every card in chunks of cards.
+
+    With nJobs > 1, the chunks are computed by a thread pool. At most nJobs chunks are computed
+    ahead of the writer, which writes them in order, so the memory does not grow with the catalog.
+
+    :param om: OmenMachine with loaded similarity information
+    :param writer: Object whose write method takes the data frame of a chunk, e.g. JsonLinesWriter
+    :param topK: Number of similar cards per card
+    :param chunkSize: Number of cards per chunk
+    :param nJobs: Number of threads. None uses all cores
+    :param filters: Filter keywords of getSimilarCards
+
+    Returns (int) number of written rows
+    """
+    if nJobs is None or nJobs < 1:
+        nJobs = os.cpu_count() or 1
+    names = om.uniqueNames
+
+    def computeChunk(start):
+        return om.getSimilarCardsBatch(names[start:start+chunkSize], queryNumber=topK, **filters)
+
+    nRows = 0
+    with ThreadPoolExecutor(max_workers=nJobs) as executor:
+        pending = deque()
+        for start in range(0, len(names), chunkSize):
+            pending.append(executor.submit(computeChunk, start))
+            if len(pending) > nJobs:
+                chunk = pending.popleft().result()
+                writer.write(chunk)
+                nRows += len(chunk)
+        while pending:
+            chunk = pending.popleft().result()
+            writer.write(chunk)
+            nRows += len(chunk)
+    return nRows
+
+
+def export(args):
+    om = _loadModel(args)
+    with _openWriter(args.outputFile, args.format) as writer:
+        nRows = exportNeighbours(om, writer, topK=args.top_k, chunkSize=args.chunk_size, nJobs=args.jobs,
+                                 **_filters(args))
+    if not args.quiet:
+        print('Exported {0} neighbours of {1} cards to {2}'.format(nRows, len(om.uniqueNames), args.outputFile))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m omenmachine', description='Content based recommendations of Magic cards.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def addModel(subparser):
+        subparser.add_argument('jsonUniqueFile', help='Json file after filtering with prepJsonFile')
+        subparser.add_argument('simDfFile', help='Similarity information written by runML')
+
+    subparser = subparsers.add_parser('prep', help='Filter a Scryfall bulk file to one card per unique name')
+    subparser.add_argument('jsonFile', help="Scryfall's bulk data json file")
+    subparser.add_argument('jsonUniqueFile', help='Output json file')
+    subparser.add_argument('--stream', action='store_true', help='Parse the bulk file incrementally with little memory')
+    subparser.add_argument('--quiet', action='store_true')
+    subparser.set_defaults(function=prep)
+
+    subparser = subparsers.add_parser('build', help='Compute and store the similarity information')
+    addModel(subparser)
+    subparser.add_argument('--mode', default='dense', choices=['dense', 'topk', 'query', 'embedding', 'memmap', 'ann'])
+    subparser.add_argument('--top-k', type=int, default=50, help='Similar cards per card in "topk" mode')
+    subparser.add_argument('--block-size', type=int, default=1000, help='Cards whose similarity is computed at once')
+    subparser.add_argument('--memory-limit', type=float, default=None,
+                           help='Memory in MB for the similarity computation, which limits the block size')
+    subparser.add_argument('--score-dtype', default=None, help='Data type of the stored scores, e.g. float16 or uint8')
+    subparser.add_argument('--jobs', type=int, default=1, help='Number of workers, 0 uses all cores')
+    subparser.add_argument('--weighting', default='count', choices=['count', 'tfidf', 'sublinear', 'bm25'])
+    subparser.add_argument('--components', type=int, default=128, help='Dimensions in "embedding" and "ann" mode')
+    subparser.add_argument('--lists', type=int, default=None, help='Clusters of the "ann" index')
+    subparser.add_argument('--probe', type=int, default=8, help='Clusters that an "ann" query visits')
+    subparser.add_argument('--quiet', action='store_true')
+    subparser.set_defaults(function=build)
+
+    subparser = subparsers.add_parser('query', help='Most similar cards of one card')
+    addModel(subparser)
+    subparser.add_argument('card', help='Name of the queried card')
+    subparser.add_argument('--number', type=int, default=10, help='Number of similar cards')
+    subparser.add_argument('--json', action='store_true', help='Print all columns as json lines')
+    _addFilterArguments(subparser)
+    subparser.set_defaults(function=query)
+
+    subparser = subparsers.add_parser('batch', help='Most similar cards of many cards')
+    addModel(subparser)
+    subparser.add_argument('cards', nargs='*', help='Names of the queried cards')
+    subparser.add_argument('--input', help='File with one card name per line, "-" reads stdin')
+    subparser.add_argument('--output', help='Output file (.jsonl, .parquet or .csv). By default json lines on stdout')
+    subparser.add_argument('--format', choices=['jsonl', 'parquet'], default=None)
+    subparser.add_argument('--number', type=int, default=10, help='Number of similar cards per card')
+    _addFilterArguments(subparser)
+    subparser.set_defaults(function=batch)
+
+    subparser = subparsers.add_parser('export', help='Most similar cards of every card in chunks')
+    addModel(subparser)
+    subparser.add_argument('outputFile', help='Output file, .parquet or .jsonl')
+    subparser.add_argument('--format', choices=['jsonl', 'parquet'], default=None)
+    subparser.add_argument('--top-k', type=int, default=50, help='Number of similar cards per card')
+    subparser.add_argument('--chunk-size', type=int, default=1000, help='Number of cards per chunk')
+    subparser.add_argument('--jobs', type=int, default=1, help='Number of threads, 0 uses all cores')
+    subparser.add_argument('--quiet', action='store_true')
+    _addFilterArguments(subparser)
+    subparser.set_defaults(function=export)
+
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    try:
+        return args.function(args) or 0
+    except (ValueError, RuntimeError, OSError) as error:
+        print('Error: {0}'.format(error), file=sys.stderr)
+        return 1
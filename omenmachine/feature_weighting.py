@@ -0,0 +1,95 @@
+# coding: utf-8
+
+import numpy as np
+
+
+# Weighting schemes of the count matrix
+weightingSchemes = ['count', 'tfidf', 'sublinear', 'bm25']
+
+
+class FeatureWeighting:
+    """
+    Weighting of the token counts before the cosine similarity is computed.
+    - "count": raw token counts, the original behaviour
+    - "tfidf": counts times the inverse document frequency, so tokens that most cards share,
+      e.g. mana symbols or "creature", contribute less
+    - "sublinear": like "tfidf" with 1+log(count) instead of the count
+    - "bm25": Okapi BM25, whose term frequency saturates and is normalized by the card text length
+
+    The document frequencies are fitted once by runML. Cards that are added by update are
+    weighted with the fitted values. Tokens that are new get the weight of a token that
+    only occurs in these cards.
+    """
+
+    def __init__(self, scheme='count', k1=1.2, b=0.75):
+        """
+        :param scheme: One of "count", "tfidf", "sublinear" or "bm25"
+        :param k1: Term frequency saturation of "bm25"
+        :param b: Length normalization of "bm25"
+        """
+        if scheme not in weightingSchemes:
+            raise ValueError('Unknown weighting {0}. Choose one of {1}.'.format(scheme, ', '.join(weightingSchemes)))
+        self.scheme = scheme
+        self.k1 = k1
+        self.b = b
+        self.nDocs = 0
+        self.docFrequency = np.zeros(0, dtype=np.int64)
+        self.avgLength = 0.
+
+
+    def _idf(self):
+        df = self.docFrequency.astype(np.float64)
+        if self.scheme == 'bm25':
+            return np.log1p((self.nDocs-df+0.5)/(df+0.5))
+        # Smoothed idf as in scikit-learn's TfidfTransformer
+        return np.log((1+self.nDocs)/(1+df))+1
+
+
+    def fit(self, countMatrix):
+        """
+        :param countMatrix: Sparse count matrix with one row per card
+        """
+        import scipy.sparse as sp
+        countMatrix = sp.csr_matrix(countMatrix)
+        self.nDocs = countMatrix.shape[0]
+        self.docFrequency = np.bincount(countMatrix.indices, minlength=countMatrix.shape[1]).astype(np.int64)
+        self.avgLength = float(countMatrix.sum())/max(self.nDocs, 1)
+        return self
+
+
+    def extend(self, countMatrix):
+        """ Add the document frequency of new tokens, e.g. after the vocabulary was extended by update
+
+        :param countMatrix: Sparse count matrix of the cards that contain the new tokens
+        """
+        nTokens = countMatrix.shape[1]
+        nNew = nTokens-len(self.docFrequency)
+        if nNew > 0:
+            import scipy.sparse as sp
+            docFrequency = np.bincount(sp.csr_matrix(countMatrix).indices, minlength=nTokens)
+            self.docFrequency = np.concatenate([self.docFrequency, np.maximum(docFrequency[-nNew:], 1)])
+        return self
+
+
+    def transform(self, countMatrix):
+        """ Weighted sparse matrix with the same shape as the count matrix """
+        import scipy.sparse as sp
+        weighted = sp.csr_matrix(countMatrix, dtype=np.float64, copy=True)
+        if self.scheme == 'count':
+            return weighted
+
+        tf = weighted.data
+        if self.scheme == 'sublinear':
+            tf[:] = 1+np.log(tf)
+        elif self.scheme == 'bm25':
+            lengths = np.asarray(weighted.sum(axis=1)).ravel()
+            rowLengths = np.repeat(lengths, np.diff(weighted.indptr))
+            norm = self.k1*(1-self.b+self.b*rowLengths/max(self.avgLength, 1e-12))
+            tf[:] = tf*(self.k1+1)/(tf+norm)
+
+        tf *= self._idf()[weighted.indices]
+        return weighted
+
+
+    def fitTransform(self, countMatrix):
+        return self.fit(countMatrix).transform(countMatrix)
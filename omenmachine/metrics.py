@@ -0,0 +1,182 @@
+# coding: utf-8
+
+import json
+import time
+import logging
+
+
+class _NullTimer:
+    """ Timer of disabled metrics, which does nothing """
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        return False
+
+
+_nullTimer = _NullTimer()
+
+
+class _Timer:
+
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter()-self.startTime, **self.labels)
+        return False
+
+
+def _labelKey(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _prometheusLabels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+
+class Metrics:
+    """
+    Opt-in timers and counters of the stages of OmenMachine, e.g. loading, feature preparation,
+    vectorizing, similarity, every filter step and the assembly of the result data frame.
+
+    Every timed stage keeps its number of calls, the total and the maximum time in seconds,
+    separately for each combination of labels (e.g. mode="topk" or filter="legality").
+    The aggregates are exported as records for structured logs or as Prometheus text.
+    A callback receives every single measurement, e.g. logCallback for one log line per event.
+
+    Disabled metrics return a shared no-op timer, so the instrumented code only pays a method call.
+    """
+
+    def __init__(self, enabled=True, callback=None):
+        """
+        :param enabled: If False, nothing is measured
+        :param callback: Function that is called with a dictionary for every measurement,
+                         {"type": "timer" or "counter", "name": ..., "value": ..., "labels": {...}}
+        """
+        self.enabled = enabled
+        self.callback = callback
+        self.reset()
+
+
+    def reset(self):
+        """ Remove all measurements """
+        # (stage, labels) -> [calls, total seconds, maximum seconds]
+        self.timers = {}
+        # (counter, labels) -> value
+        self.counters = {}
+
+
+    def timer(self, stage, **labels):
+        """ Context manager that measures the time of a stage
+
+            with metrics.timer('similarity', mode='topk'):
+                ...
+        """
+        if not self.enabled:
+            return _nullTimer
+        return _Timer(self, stage, labels)
+
+
+    def observe(self, stage, seconds, **labels):
+        """ Add a time in seconds to a stage """
+        if not self.enabled:
+            return
+        key = (stage, _labelKey(labels))
+        timer = self.timers.get(key)
+        if timer is None:
+            self.timers[key] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+        if self.callback is not None:
+            self.callback({'type': 'timer', 'name': stage, 'value': seconds, 'labels': labels})
+
+
+    def count(self, counter, value=1, **labels):
+        """ Increase a counter, e.g. the number of filtered cards """
+        if not self.enabled:
+            return
+        key = (counter, _labelKey(labels))
+        self.counters[key] = self.counters.get(key, 0)+value
+        if self.callback is not None:
+            self.callback({'type': 'counter', 'name': counter, 'value': value, 'labels': labels})
+
+
+    def records(self):
+        """ List of dictionaries with the aggregated timers and counters, e.g. for structured logs """
+        records = []
+        for (stage, labels), (calls, total, maximum) in sorted(self.timers.items()):
+            records.append({'type': 'timer', 'name': stage, 'labels': dict(labels),
+                            'calls': calls, 'seconds': total, 'maxSeconds': maximum})
+        for (counter, labels), value in sorted(self.counters.items()):
+            records.append({'type': 'counter', 'name': counter, 'labels': dict(labels), 'value': value})
+        return records
+
+
+    def toJsonLines(self):
+        """ The records as one json object per line """
+        return ''.join(json.dumps(record)+'\n' for record in self.records())
+
+
+    def toPrometheus(self, namespace='omenmachine'):
+        """ The timers as summaries and the counters in the Prometheus text exposition format """
+        lines = []
+        if self.timers:
+            name = '{0}_stage_seconds'.format(namespace)
+            lines.append('# HELP {0} Time spent in the stages of OmenMachine.'.format(name))
+            lines.append('# TYPE {0} summary'.format(name))
+            for (stage, labels), (calls, total, _) in sorted(self.timers.items()):
+                labels = _prometheusLabels((('stage', stage),)+labels)
+                lines.append('{0}_sum{1} {2!r}'.format(name, labels, float(total)))
+                lines.append('{0}_count{1} {2}'.format(name, labels, calls))
+
+            name = '{0}_stage_max_seconds'.format(namespace)
+            lines.append('# HELP {0} Longest time of a single call of the stages of OmenMachine.'.format(name))
+            lines.append('# TYPE {0} gauge'.format(name))
+            for (stage, labels), (_, _, maximum) in sorted(self.timers.items()):
+                lines.append('{0}{1} {2!r}'.format(name, _prometheusLabels((('stage', stage),)+labels), float(maximum)))
+
+        for counter in sorted(set(counter for counter, _ in self.counters)):
+            name = '{0}_{1}_total'.format(namespace, counter)
+            lines.append('# TYPE {0} counter'.format(name))
+            for (other, labels), value in sorted(self.counters.items()):
+                if other == counter:
+                    lines.append('{0}{1} {2}'.format(name, _prometheusLabels(labels), value))
+        return ''.join(line+'\n' for line in lines)
+
+
+def logCallback(logger=None, level=logging.INFO):
+    """ Callback for Metrics that logs every measurement as one json line
+
+    :param logger: logging.Logger, by default the logger "omenmachine.metrics"
+    :param level: Log level of the measurements
+    """
+    if logger is None:
+        logger = logging.getLogger('omenmachine.metrics')
+
+    def callback(event):
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(event, default=str))
+    return callback
+
+
+# Shared instance for OmenMachine objects without metrics
+disabledMetrics = Metrics(enabled=False)
@@ -0,0 +1,161 @@
+# coding: utf-8
+
+import re
+import bisect
+import unicodedata
+
+import numpy as np
+
+
+_whiteSpaces = re.compile(r'\s+')
+_quotes = str.maketrans({'’': "'", '‘': "'", '“': '"', '”': '"', '–': '-', '—': '-'})
+
+
+def normalizeName(name):
+    """ Normalize a card name for lookups: case, accents, quotes and white spaces are ignored,
+    e.g. "Lim-Dûl’s  Vault" becomes "lim-dul's vault"
+    """
+    name = unicodedata.normalize('NFKD', name.translate(_quotes))
+    name = ''.join(character for character in name if not unicodedata.combining(character))
+    return _whiteSpaces.sub(' ', name).strip().casefold()
+
+
+def nameTrigrams(name):
+    """ Set of character trigrams of a normalized name, padded to weight the start of the name """
+    padded = '  {0} '.format(name)
+    return {padded[start:start+3] for start in range(len(padded)-2)}
+
+
+class NameIndex:
+    """
+    Index of the card names for queries.
+    - Exact and normalized names are resolved with one dictionary lookup
+    - Faces of double-faced cards resolve to the card, e.g. "Delver of Secrets"
+      to "Delver of Secrets // Insectile Aberration"
+    - Prefixes are completed with a binary search on the sorted names
+    - Near-misses are resolved with a trigram index, which is built when it is first needed
+    """
+
+    def __init__(self, names):
+        """
+        :param names: List of card names. The position in the list is the row id
+        """
+        self.names = list(names)
+        self.exactRowIds = {name: rowId for rowId, name in enumerate(self.names)}
+
+        # Normalized full names take precedence over the names of single faces
+        self.rowIds = {}
+        faceNames = []
+        for rowId, name in enumerate(self.names):
+            self.rowIds.setdefault(normalizeName(name), rowId)
+            if ' // ' in name:
+                faceNames += [(normalizeName(faceName), rowId) for faceName in name.split(' // ')]
+        for faceName, rowId in faceNames:
+            self.rowIds.setdefault(faceName, rowId)
+
+        # Sorted keys for prefix completion
+        self.keys = sorted(self.rowIds)
+        self.keyRowIds = np.array([self.rowIds[key] for key in self.keys], dtype=np.int64)
+
+        self._trigrams = None
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+
+    def lookup(self, name):
+        """ Row id of an exact, normalized or face name. None if the name is unknown """
+        rowId = self.exactRowIds.get(name)
+        if rowId is None:
+            rowId = self.rowIds.get(normalizeName(name))
+        return rowId
+
+
+    def _buildTrigrams(self):
+        postings = {}
+        nTrigrams = np.zeros(len(self.keys), dtype=np.int64)
+        for keyId, key in enumerate(self.keys):
+            trigrams = nameTrigrams(key)
+            nTrigrams[keyId] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(keyId)
+
+        self._trigrams = (
+            {trigram: np.array(keyIds, dtype=np.int64) for trigram, keyIds in postings.items()},
+            nTrigrams
+            )
+
+
+    def suggest(self, name, number=5, cutoff=0.3):
+        """ Most similar card names in terms of shared character trigrams
+
+        :param name: Queried name
+        :param number: Maximum number of suggestions
+        :param cutoff: Minimum trigram similarity between 0 and 1
+
+        Returns (list) of (name, similarity) tuples, sorted by decreasing similarity
+        """
+        if self._trigrams is None:
+            self._buildTrigrams()
+        postings, nTrigrams = self._trigrams
+
+        trigrams = nameTrigrams(normalizeName(name))
+        keyIds = [postings[trigram] for trigram in trigrams if trigram in postings]
+        if not keyIds:
+            return []
+
+        # Number of shared trigrams per key and the Jaccard similarity of the trigram sets
+        shared = np.bincount(np.concatenate(keyIds), minlength=len(self.keys))
+        similarity = shared/(len(trigrams)+nTrigrams-shared)
+
+        candidates = np.flatnonzero(similarity >= cutoff)
+        candidates = candidates[np.lexsort((candidates, -similarity[candidates]))]
+
+        suggestions = []
+        for keyId in candidates:
+            cardName = self.names[self.keyRowIds[keyId]]
+            if all(cardName != suggestion for suggestion, _ in suggestions):
+                suggestions.append((cardName, float(similarity[keyId])))
+            if len(suggestions) == number:
+                break
+        return suggestions
+
+
+    def resolve(self, name, cutoff=0.6):
+        """ Row id of a card name that may contain typos
+
+        :param name: Queried name
+        :param cutoff: Minimum trigram similarity of a near-miss
+
+        Returns (int) row id, or None if no card is similar enough
+        """
+        rowId = self.lookup(name)
+        if rowId is None:
+            suggestions = self.suggest(name, number=1, cutoff=cutoff)
+            if suggestions:
+                rowId = self.exactRowIds[suggestions[0][0]]
+        return rowId
+
+
+    def complete(self, prefix, limit=10):
+        """ Card names that start with a prefix, in alphabetical order of their normalized names
+
+        :param prefix: Beginning of the name, case and accents are ignored
+        :param limit: Maximum number of names
+        """
+        prefix = normalizeName(prefix)
+        start = bisect.bisect_left(self.keys, prefix)
+
+        names = []
+        for keyId in range(start, len(self.keys)):
+            if not self.keys[keyId].startswith(prefix) or len(names) == limit:
+                break
+            cardName = self.names[self.keyRowIds[keyId]]
+            if cardName not in names:
+                names.append(cardName)
+        return names
@@ -0,0 +1,86 @@
+# coding: utf-8
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .name_index import normalizeName
+
+
+def _filterKey(value):
+    """ Hashable form of a filter value. The order of list filters does not change the result """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return ''.join(value.split())
+    return frozenset(str(item) for item in np.atleast_1d(value))
+
+
+def queryKey(magicCard, queryNumber, **filters):
+    """ Cache key of a query: the normalized card name, the number of cards and all filters
+
+    :param magicCard: String of the queried card name
+    :param queryNumber: Number of returned cards
+    :param filters: Filter keywords of getSimilarCards
+    """
+    return (normalizeName(magicCard), int(queryNumber)) + tuple(
+        (name, _filterKey(value)) for name, value in sorted(filters.items())
+        )
+
+
+class ResultCache:
+    """
+    Size-bounded cache of query results, which evicts the least recently used result.
+    Hits and misses are counted over the lifetime of the cache.
+    """
+
+    def __init__(self, maxSize=1024):
+        """
+        :param maxSize: Maximum number of cached results
+        """
+        if maxSize < 1:
+            raise ValueError('maxSize has to be at least 1, not {0}.'.format(maxSize))
+        self.maxSize = maxSize
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self._results)
+
+
+    def get(self, key):
+        """ Cached result of a key, or None if it is not cached """
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end(key)
+        return result
+
+
+    def put(self, key, result):
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxSize:
+            self._results.popitem(last=False)
+
+
+    def clear(self):
+        """ Remove all results, e.g. when the similarity information changes """
+        self._results.clear()
+
+
+    @property
+    def stats(self):
+        """ Dictionary with the number of hits, misses and cached results and the hit rate """
+        nQueries = self.hits+self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self),
+            'maxSize': self.maxSize,
+            'hitRate': self.hits/nQueries if nQueries else 0.,
+            }
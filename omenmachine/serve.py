@@ -0,0 +1,398 @@
+# coding: utf-8
+
+""" HTTP/JSON service for card recommendations.
+
+    python -m omenmachine.serve default-cards-unique.json SimilarCardsDf --port 8080 --workers 4
+
+The similarity information is loaded once by the parent process. The workers are forked
+afterwards, so they share it: memory-mapped stores ("memmap" mode) through the page cache
+and all other modes as copy-on-write memory. Every worker runs an asyncio server on the
+shared listening socket and answers one request at a time in a separate thread, so the event loop
+keeps reading and writing the other connections while a query is computed.
+
+Endpoints:
+- GET  /similar?card=Omen+Machine&queryNumber=10&colorFilter=G&colorFilter=R
+- POST /batch with a json body {"cards": [...], "queryNumber": 10, "legalityFilter": "modern"}
+- GET  /autocomplete?prefix=omen&limit=10
+- GET  /health
+- GET  /metrics in the Prometheus text format, if the service runs with --metrics.
+  Every worker has its own metrics, so consecutive scrapes can come from different workers
+List filters are passed as repeated parameters or comma-separated values.
+"""
+
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import urllib.parse
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+from .card_recommendation import OmenMachine
+from .card_filters import cmcPattern
+from .metrics import Metrics
+
+
+logger = logging.getLogger('omenmachine.serve')
+
+
+# Filters of getSimilarCards and whether they take a list of values
+filterParameters = {
+    'cmcFilter': False,
+    'colorFilter': True,
+    'commanderFilter': True,
+    'typeFilter': True,
+    'rarityFilter': True,
+    'legalityFilter': True,
+    }
+
+
+class ServiceError(Exception):
+    """ Error that is returned to the client with an HTTP status """
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def _listValue(values):
+    """ Repeated parameters and comma-separated values as one list """
+    if isinstance(values, str):
+        values = [values]
+    return [value for valueList in values for value in valueList.split(',') if value]
+
+
+def _parseFilters(parameters, attributes):
+    """ Filter keywords of getSimilarCards from query parameters or a json body. A null value keeps the default
+
+    :param parameters: Dictionary of the query parameters or the json body
+    :param attributes: CardAttributes of the cards, which know the formats of the legality filter
+    """
+    filters = {}
+    for name, values in parameters.items():
+        if name not in filterParameters or values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values) or \
+                not (values or filterParameters[name]):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, '{0} has to be a string{1}.'.format(
+                name, ' or a list of strings' if filterParameters[name] else ''))
+
+        # Repeated query parameters of a single-value filter: the last one wins
+        filters[name] = _listValue(values) if filterParameters[name] else values[-1]
+
+    if 'cmcFilter' in filters and cmcPattern.match(filters['cmcFilter']) is None:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, 'Invalid cmcFilter {0}. Use e.g. ">=2".'.format(filters['cmcFilter']))
+    unknownFormats = [formatName for formatName in filters.get('legalityFilter', [])
+                      if formatName not in attributes.formatNames]
+    if unknownFormats:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, 'Unknown format {0} in legalityFilter.'.format(', '.join(unknownFormats)))
+    return filters
+
+
+def _parseInt(value, name, minimum=1, maximum=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, '{0} has to be an integer.'.format(name))
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, '{0} has to be between {1} and {2}.'.format(name, minimum, maximum))
+    return value
+
+
+def _records(df):
+    """ Rows of a data frame as a list of dictionaries, with NaN as None """
+    return json.loads(df.to_json(orient='records', force_ascii=False))
+
+
+class RecommendationService:
+    """
+    Request handling of the HTTP service. It is independent of the network, so it can be
+    used in-process, e.g. with InProcessClient, or served with asyncio by serve.
+
+    handleConnection answers the requests in a single thread per process. The OmenMachine,
+    e.g. its result cache and metrics, is not thread-safe, so the service scales with processes.
+    """
+
+    def __init__(self, om, maxQueryNumber=100, maxBatchSize=1000):
+        """
+        :param om: OmenMachine with loaded similarity information
+        :param maxQueryNumber: Maximum number of returned cards per query
+        :param maxBatchSize: Maximum number of cards in a batch request
+        """
+        self.om = om
+        self.maxQueryNumber = maxQueryNumber
+        self.maxBatchSize = maxBatchSize
+        self.routes = {
+            ('GET', '/similar'): self.similar,
+            ('GET', '/autocomplete'): self.autocomplete,
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/batch'): self.batch,
+            }
+        # Created in the process that serves, because threads do not survive os.fork
+        self.executor = None
+
+
+    def handle(self, method, target, body=b''):
+        """ Answer a request
+
+        :param method: HTTP method, e.g. "GET"
+        :param target: Path with query string, e.g. "/similar?card=Omen+Machine"
+        :param body: Raw request body
+
+        Returns (int), (dict): HTTP status and json payload, or (str) plain text for /metrics
+        """
+        url = urllib.parse.urlsplit(target)
+        parameters = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        route = self.routes.get((method, url.path))
+        if route is None:
+            if any(path == url.path for _, path in self.routes):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Method {0} is not allowed.'.format(method)}
+            return HTTPStatus.NOT_FOUND, {'error': 'Unknown path {0}.'.format(url.path)}
+
+        # The routes validate their parameters and raise a ServiceError for invalid requests,
+        # so every other exception is an error of the service
+        try:
+            if method == 'POST':
+                try:
+                    payload = json.loads(body.decode('utf-8') or '{}')
+                except ValueError:
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, 'The body is not valid json.')
+                if not isinstance(payload, dict):
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, 'The body has to be a json object.')
+                return HTTPStatus.OK, route(payload)
+            return HTTPStatus.OK, route({name: values[-1] if len(values) == 1 else values
+                                         for name, values in parameters.items()})
+        except ServiceError as error:
+            return error.status, {'error': str(error)}
+        except Exception:
+            logger.exception('Request %s %s failed', method, target)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error.'}
+
+
+    def health(self, parameters):
+        return {'status': 'ok', 'cards': len(self.om.uniqueNames), 'pid': os.getpid()}
+
+
+    def metrics(self, parameters):
+        if not self.om.metrics.enabled:
+            raise ServiceError(HTTPStatus.NOT_FOUND, 'Metrics are disabled.')
+        return self.om.metrics.toPrometheus()
+
+
+    def similar(self, parameters):
+        card = parameters.get('card')
+        if not isinstance(card, str) or not card:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, 'The parameter card is missing.')
+        queryNumber = _parseInt(parameters.get('queryNumber', 10), 'queryNumber', 0, self.maxQueryNumber)
+        filters = _parseFilters(parameters, self.om.cardAttributes)
+
+        rowId = self.om.nameIndex.resolve(card)
+        if rowId is None:
+            message = 'Magic card {0} is not in the database.'.format(card)
+            suggestions = self.om.nameIndex.suggest(card, number=3)
+            if suggestions:
+                message += ' Did you mean: {0}?'.format(', '.join(name for name, _ in suggestions))
+            raise ServiceError(HTTPStatus.NOT_FOUND, message)
+
+        result = self.om.getSimilarCards(self.om.uniqueNames[rowId], queryNumber=queryNumber, **filters)
+        return {'card': self.om.uniqueNames[rowId], 'results': _records(result)}
+
+
+    def batch(self, payload):
+        cards = payload.get('cards')
+        if not isinstance(cards, list) or not all(isinstance(card, str) for card in cards):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, 'cards has to be a list of card names.')
+        if len(cards) > self.maxBatchSize:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, 'At most {0} cards per batch.'.format(self.maxBatchSize))
+        queryNumber = _parseInt(payload.get('queryNumber', 10), 'queryNumber', 0, self.maxQueryNumber)
+        filters = _parseFilters(payload, self.om.cardAttributes)
+
+        rowIds = [self.om.nameIndex.resolve(card) for card in cards]
+        unknown = [card for card, rowId in zip(cards, rowIds) if rowId is None]
+        names = [self.om.uniqueNames[rowId] for rowId in rowIds if rowId is not None]
+
+        result = self.om.getSimilarCardsBatch(names, queryNumber=queryNumber, **filters)
+        return {'results': _records(result), 'unknown': unknown}
+
+
+    def autocomplete(self, parameters):
+        prefix = parameters.get('prefix', '')
+        if not isinstance(prefix, str):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, 'prefix has to be given once.')
+        limit = _parseInt(parameters.get('limit', 10), 'limit', 1, self.maxQueryNumber)
+        return {'names': self.om.nameIndex.complete(prefix, limit=limit)}
+
+
+    async def handleConnection(self, reader, writer):
+        """ Serve the HTTP/1.1 requests of one connection, which is kept alive unless the client closes it """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                try:
+                    method, target, version = requestLine.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line.'}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b''
+                try:
+                    contentLength = int(headers.get('content-length', 0) or 0)
+                    if contentLength < 0:
+                        raise ValueError(contentLength)
+                except ValueError:
+                    # The end of the body is unknown, so the connection cannot be used any further
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': 'Invalid Content-Length.'}, False)
+                    break
+                if contentLength:
+                    body = await reader.readexactly(contentLength)
+
+                keepAlive = (headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0')
+                # The queries block, so they run outside of the event loop
+                status, payload = await loop.run_in_executor(self.executor, self.handle, method.upper(), target, body)
+                await self._respond(writer, status, payload, keepAlive)
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    @staticmethod
+    async def _respond(writer, status, payload, keepAlive):
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            contentType = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            contentType = 'application/json; charset=utf-8'
+        head = 'HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: {3}\r\nConnection: {4}\r\n\r\n'.format(
+            int(status), HTTPStatus(status).phrase, contentType, len(body), 'keep-alive' if keepAlive else 'close')
+        writer.write(head.encode('latin-1')+body)
+        await writer.drain()
+
+
+class InProcessClient:
+    """ Client that calls a RecommendationService directly, e.g. for tests without a network """
+
+    def __init__(self, service):
+        self.service = service
+
+
+    def get(self, path, **parameters):
+        """ Returns (int), (dict): HTTP status and json payload """
+        query = urllib.parse.urlencode(parameters, doseq=True)
+        status, payload = self.service.handle('GET', path+('?'+query if query else ''))
+        # Encode and decode like the server, so the payload only contains json types
+        return int(status), json.loads(json.dumps(payload))
+
+
+    def post(self, path, data):
+        status, payload = self.service.handle('POST', path, json.dumps(data).encode('utf-8'))
+        return int(status), json.loads(json.dumps(payload))
+
+
+def _runWorker(service, sock):
+    async def run():
+        server = await asyncio.start_server(service.handleConnection, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(service, host='127.0.0.1', port=8080, workers=1):
+    """ Serve a RecommendationService with pre-forked worker processes
+
+    :param service: RecommendationService with the loaded OmenMachine
+    :param host: Address the service listens on
+    :param port: Port the service listens on
+    :param workers: Number of worker processes. Without os.fork, e.g. on Windows, one process serves
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.setblocking(False)
+
+    if workers <= 1 or not hasattr(os, 'fork'):
+        _runWorker(service, sock)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # The worker shares the loaded similarity information with the parent
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _runWorker(service, sock)
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+    sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m omenmachine.serve', description='HTTP/JSON service for card recommendations.')
+    parser.add_argument('jsonUniqueFile', help='Json file after filtering with prepJsonFile')
+    parser.add_argument('simDfFile', help='Similarity information written by runML')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Cached results per worker, 0 disables the cache')
+    parser.add_argument('--metrics', action='store_true', help='Time the query stages and serve them at /metrics')
+    args = parser.parse_args(argv)
+
+    om = OmenMachine(args.jsonUniqueFile, args.simDfFile, chatty=False, cacheSize=args.cache_size,
+                     metrics=Metrics() if args.metrics else None)
+    om.loadML()
+
+    print('Serving {0} cards on http://{1}:{2} with {3} workers'.format(
+        len(om.uniqueNames), args.host, args.port, args.workers))
+    sys.stdout.flush()
+    serve(RecommendationService(om), args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
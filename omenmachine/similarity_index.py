@@ -0,0 +1,754 @@
+# coding: utf-8
+
+import os
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def normalizeRows(countMatrix, dtype=np.float64):
+    """ L2-normalize the rows of a sparse count matrix.
+    The cosine similarity of normalized rows is their dot product.
+
+    :param countMatrix: Sparse count matrix with one row per card
+    :param dtype: Data type of the normalized matrix
+    """
+    if countMatrix.shape[0] == 0:
+        # e.g. no changed cards in update
+        return countMatrix.astype(dtype).tocsr()
+    from sklearn.preprocessing import normalize
+    return normalize(countMatrix.astype(dtype), norm='l2', copy=True).tocsr()
+
+
+def reduceDimensions(featureMatrix, nComponents=128, seed=0):
+    """ Project a sparse feature matrix to a few dense dimensions with a truncated SVD
+
+    :param featureMatrix: Sparse matrix with one row per card
+    :param nComponents: Number of dimensions. It is limited by the number of features
+    :param seed: Seed of the randomized SVD
+
+    Returns (np.ndarray), (np.ndarray): L2-normalized float32 vectors of shape (N, nComponents)
+    and the components (nComponents, nFeatures), with which further rows are projected
+    """
+    from sklearn.decomposition import TruncatedSVD
+
+    nComponents = max(1, min(nComponents, featureMatrix.shape[1]-1, featureMatrix.shape[0]-1))
+    svd = TruncatedSVD(n_components=nComponents, algorithm='randomized', random_state=seed)
+    vectors = svd.fit_transform(featureMatrix)
+    components = svd.components_.astype(np.float32)
+    return normalizeVectors(vectors), components
+
+
+def normalizeVectors(vectors):
+    """ L2-normalize the rows of a dense array as float32 """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors/np.maximum(norms, np.float32(1e-12))
+
+
+def quantizeScores(scores, dtype):
+    """ Convert similarity scores to the data type in which they are stored.
+    Scores of non-negative features are between 0 and 1, so "uint8" stores them
+    as multiples of 1/255 in a single byte.
+
+    :param scores: Array with similarity scores
+    :param dtype: Data type of the stored scores, e.g. "float32", "float16" or "uint8"
+    """
+    dtype = np.dtype(dtype)
+    if dtype == np.uint8:
+        return np.rint(np.clip(scores, 0., 1.)*255).astype(np.uint8)
+    return np.asarray(scores, dtype=dtype)
+
+
+def dequantizeScores(scores):
+    """ Stored similarity scores as floating point numbers, at least float32 """
+    if scores.dtype == np.uint8:
+        return scores.astype(np.float32)/np.float32(255)
+    return np.asarray(scores, dtype=np.result_type(scores.dtype, np.float32))
+
+
+def blockCosineSimilarity(countMatrix, blockSize=1000, nJobs=1, reduceBlock=None):
+    """ Compute the cosine similarity of a count matrix in blocks of rows.
+
+    With nJobs > 1, the blocks are computed by a thread pool. The sparse matrix products
+    release the GIL, so the threads run on separate cores. At most nJobs blocks are
+    computed ahead of the consumer, so the peak memory is bounded by the block size.
+
+    :param countMatrix: Sparse count matrix with one row per card
+    :param blockSize: Number of rows whose similarity is computed at once
+    :param nJobs: Number of threads. None uses all cores
+    :param reduceBlock: Function that is applied to every block and its row ids in the
+                        worker thread, e.g. to select the most similar cards of every row
+
+    Yields (int), (int), (np.ndarray): first row, last row (exclusive)
+    and the dense similarity block of shape (stop-start, N), or the output of reduceBlock
+    """
+    if nJobs is None or nJobs < 1:
+        nJobs = os.cpu_count() or 1
+
+    normalized = normalizeRows(countMatrix)
+    transposed = normalized.T.tocsc()
+    nRows = normalized.shape[0]
+
+    def computeBlock(start):
+        stop = min(start+blockSize, nRows)
+        block = (normalized[start:stop] @ transposed).toarray()
+        if reduceBlock is not None:
+            block = reduceBlock(block, np.arange(start, stop))
+        return start, stop, block
+
+    if nJobs == 1:
+        for start in range(0, nRows, blockSize):
+            yield computeBlock(start)
+        return
+
+    with ThreadPoolExecutor(max_workers=nJobs) as executor:
+        # Blocks are returned in order, while the next ones are computed
+        pending = deque()
+        for start in range(0, nRows, blockSize):
+            pending.append(executor.submit(computeBlock, start))
+            if len(pending) >= nJobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def rankScores(scores, rowId, topN=None):
+    """ Sort the similarity of one card to all cards
+
+    :param scores: Array with the similarity of the card to all cards
+    :param rowId: Row id of the card, which is excluded from the ranking
+    :param topN: Number of returned cards. If None, all other cards are returned
+
+    Returns (np.ndarray), (np.ndarray): row ids and scores sorted by decreasing score
+    """
+    scores = np.array(scores, dtype=np.result_type(scores.dtype, np.float32))
+    # Exclude the card itself
+    scores[rowId] = -np.inf
+
+    nOthers = len(scores)-1
+    if topN is not None and topN < nOthers:
+        # Select the candidates without sorting all cards
+        candidates = np.argpartition(-scores, max(topN-1, 0))[:topN]
+    else:
+        candidates = np.arange(len(scores))
+        candidates = candidates[candidates != rowId]
+
+    order = np.argsort(-scores[candidates], kind='stable')
+    candidates = candidates[order]
+    return candidates, scores[candidates]
+
+
+def searchScores(scores, rowId, filterMask, queryNumber):
+    """ Walk the cards in order of decreasing similarity and stop
+    as soon as queryNumber cards pass the filters.
+
+    Candidates are selected in growing chunks with np.argpartition, so typical queries
+    only filter a small fraction of the cards. When the filters are very selective,
+    they are evaluated once for all cards instead.
+
+    :param scores: Array with the similarity of the card to all cards
+    :param rowId: Row id of the card, which is excluded from the results.
+                  An array of row ids excludes several cards
+    :param filterMask: Function that returns a boolean mask for an array of row ids,
+                       or for all cards if it is called with None
+    :param queryNumber: Number of returned cards
+
+    Returns (np.ndarray), (np.ndarray): row ids and scores sorted by decreasing score.
+    Cards with equal scores are ordered by row id.
+    """
+    scores = np.array(scores, dtype=np.result_type(scores.dtype, np.float32))
+    # Exclude the card itself
+    scores[rowId] = -np.inf
+    nCards = len(scores)
+
+    if queryNumber <= 0:
+        return np.array([], dtype=np.intp), scores[:0]
+
+    chunkSize = max(4*queryNumber, 64)
+    while chunkSize < nCards//4:
+        # Score of the chunkSize-th most similar card.
+        # All cards with at least this score are candidates, so ties are not cut arbitrarily
+        threshold = -np.partition(-scores, chunkSize-1)[chunkSize-1]
+        if threshold == -np.inf:
+            # Fewer than chunkSize cards can be returned, e.g. of the candidates of an approximate index.
+            # The fallback does not return the excluded cards
+            break
+        candidates = np.flatnonzero(scores >= threshold)
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+        candidates = candidates[filterMask(candidates)]
+        if len(candidates) >= queryNumber:
+            candidates = candidates[:queryNumber]
+            return candidates, scores[candidates]
+
+        chunkSize *= 4
+
+    # The filters are very selective: evaluate them for all cards at once
+    candidates = np.flatnonzero(filterMask(None))
+    candidates = candidates[scores[candidates] > -np.inf]
+    if len(candidates) > queryNumber:
+        threshold = -np.partition(-scores[candidates], queryNumber-1)[queryNumber-1]
+        candidates = candidates[scores[candidates] >= threshold]
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')][:queryNumber]
+    return candidates, scores[candidates]
+
+
+def searchScoresBatch(scores, queryNumber):
+    """ Select the most similar cards for a batch of queried cards
+
+    :param scores: Array (nQueries, N) with the similarity of every queried card to all cards.
+                   Excluded cards, e.g. the ones that do not pass the filters, are -np.inf
+    :param queryNumber: Number of returned cards per queried card
+
+    Returns (np.ndarray), (np.ndarray), (np.ndarray): position of the queried card in the batch,
+    row ids and scores of the selected cards. They are grouped by queried card and sorted
+    by decreasing score. Cards with equal scores are ordered by row id.
+    """
+    nQueries, nCards = scores.shape
+    kth = min(queryNumber, nCards)-1
+    if kth < 0:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, scores[:0, 0]
+
+    # Score of the queryNumber-th most similar card of each queried card
+    threshold = -np.partition(-scores, kth, axis=1)[:, kth:kth+1]
+
+    # Cards tied with the threshold are taken in order of their row id
+    above = scores > threshold
+    ties = scores == threshold
+    nTies = queryNumber-above.sum(axis=1, keepdims=True)
+    selected = above | (ties & (np.cumsum(ties, axis=1) <= nTies))
+    selected &= scores > -np.inf
+
+    queries, rowIds = np.nonzero(selected)
+    selectedScores = scores[queries, rowIds]
+    order = np.lexsort((rowIds, -selectedScores, queries))
+    return queries[order], rowIds[order], selectedScores[order]
+
+
+def centroidScores(rows, rowIds, weights):
+    """ Cosine similarity of all cards to the weighted centroid of several cards,
+    computed from the similarity rows of these cards.
+
+    With normalized feature vectors x, the centroid is c = sum(w_i x_i) and
+    x . c = sum(w_i S_i), |c|^2 = sum(w_i w_j S_ij), so no feature vector is needed.
+
+    :param rows: Array (len(rowIds), N) with the similarity of the cards to all cards
+    :param rowIds: Row ids of the cards
+    :param weights: Weight of each card, e.g. the number of copies in a deck
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    scores = weights @ rows
+    norm = np.sqrt(max(weights @ rows[:, rowIds] @ weights, 0.))
+    if norm > 0:
+        scores /= norm
+    return scores
+
+
+def topKCosineSimilarity(countMatrix, topK=50, blockSize=1000, dtype=np.float32, nJobs=1):
+    """ Compute the most similar rows for every row of a count matrix.
+
+    The cosine similarity is computed in blocks of rows, so the full N x N
+    similarity matrix never exists in memory. Only the topK scores per row are kept.
+
+    :param countMatrix: Sparse count matrix with one row per card
+    :param topK: Number of neighbours that are kept per card
+    :param blockSize: Number of rows whose similarity is computed at once
+    :param dtype: Data type of the scores, "float32" or "float16"
+    :param nJobs: Number of threads that compute the blocks. None uses all cores
+
+    Returns (np.ndarray), (np.ndarray): neighbour row ids (int32) and their
+    similarity scores (dtype), both of shape (N, topK) and sorted by decreasing score.
+    The card itself is not part of its neighbours.
+    """
+    nRows = countMatrix.shape[0]
+    topK = max(0, min(topK, nRows-1))
+
+    neighbours = np.empty((nRows, topK), dtype=np.int32)
+    scores = np.empty((nRows, topK), dtype=dtype)
+    if topK == 0:
+        return neighbours, scores
+
+    def reduceBlock(block, rowIds):
+        return selectTopK(block, rowIds, topK)
+
+    for start, stop, (blockNeighbours, blockScores) in blockCosineSimilarity(countMatrix, blockSize, nJobs, reduceBlock):
+        neighbours[start:stop], scores[start:stop] = blockNeighbours, blockScores
+
+    return neighbours, scores
+
+
+def selectTopK(block, rowIds, topK):
+    """ Select the most similar cards of every row of a similarity block
+
+    :param block: Dense similarity block of shape (len(rowIds), N). It is modified in place
+    :param rowIds: Row ids of the cards in the block, which are excluded from their own neighbours
+    :param topK: Number of selected cards per row
+
+    Returns (np.ndarray), (np.ndarray): neighbour row ids and float32 scores of shape (len(rowIds), topK)
+    """
+    # Exclude the card itself
+    block[np.arange(len(rowIds)), rowIds] = -np.inf
+
+    # Select the topK candidates without sorting the full row
+    candidates = np.argpartition(-block, topK-1, axis=1)[:, :topK]
+    candidateScores = np.take_along_axis(block, candidates, axis=1).astype(np.float32)
+
+    # Only the candidates are sorted. Cards with equal scores are ordered by row id
+    order = np.lexsort((candidates, -candidateScores), axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidateScores, order, axis=1)
+
+
+class TopKIndex:
+    """
+    Compact similarity index that only keeps the topK most similar cards per card.
+    Its size grows linearly with the number of cards (N x topK) instead of quadratically.
+    """
+
+    def __init__(self, names, neighbours, scores):
+        """
+        :param names: List of card names. The position in the list is the row id
+        :param neighbours: Array (N, topK) with the row ids of the most similar cards
+        :param scores: Array (N, topK) with the corresponding similarity scores
+        """
+        self.names = list(names)
+        self.neighbours = neighbours
+        self.scores = scores
+
+
+    @classmethod
+    def fromCountMatrix(cls, names, countMatrix, topK=50, blockSize=1000, dtype=np.float32, nJobs=1):
+        neighbours, scores = topKCosineSimilarity(countMatrix, topK=topK, blockSize=blockSize, dtype=dtype, nJobs=nJobs)
+        return cls(names, neighbours, scores)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    @property
+    def topK(self):
+        return self.neighbours.shape[1]
+
+
+    def query(self, rowId):
+        """ Return the neighbours of a card
+
+        :param rowId: Row id of the queried card
+
+        Returns (np.ndarray), (np.ndarray): row ids and scores sorted by decreasing score
+        """
+        return self.neighbours[rowId], self.scores[rowId]
+
+
+    def batchScores(self, rowIds):
+        """ Similarity of several cards to all cards. Cards that are not neighbours are -np.inf
+
+        :param rowIds: Row ids of the queried cards
+        """
+        rowIds = np.asarray(rowIds)
+        scores = np.full((len(rowIds), len(self.names)), -np.inf, dtype=np.float32)
+        np.put_along_axis(scores, self.neighbours[rowIds].astype(np.intp), self.scores[rowIds].astype(np.float32), axis=1)
+        return scores
+
+
+    def centroidScores(self, rowIds, weights):
+        """ Similarity of all cards to the weighted centroid of several cards.
+        Only neighbours contribute, so this is an approximation of the exact centroid similarity.
+
+        :param rowIds: Row ids of the cards
+        :param weights: Weight of each card
+        """
+        rows = self.batchScores(rowIds)
+        rows[rows == -np.inf] = 0.
+        rows[np.arange(len(rowIds)), rowIds] = 1.
+        return centroidScores(rows, rowIds, weights)
+
+
+    def update(self, names, featureMatrix, affectedIds, blockSize=1000):
+        """ Update the neighbour lists after cards were added or changed.
+        New cards are appended, so the row ids of the existing cards stay the same.
+
+        :param names: List of all card names after the update
+        :param featureMatrix: L2-normalized sparse matrix of all cards after the update
+        :param affectedIds: Row ids of the added and changed cards
+        :param blockSize: Number of rows whose similarity is computed at once
+        """
+        nRows = len(names)
+        topK = self.topK
+        affectedIds = np.asarray(affectedIds, dtype=np.intp)
+        transposed = featureMatrix.T.tocsc()
+
+        isAffected = np.zeros(nRows, dtype=bool)
+        isAffected[affectedIds] = True
+
+        # The neighbour lists of the new cards, the changed cards and of all cards that
+        # had a changed card as neighbour have to be computed again
+        stale = np.flatnonzero(isAffected[self.neighbours].any(axis=1))
+        recompute = np.union1d(stale, affectedIds)
+
+        neighbours = np.zeros((nRows, topK), dtype=np.int32)
+        scores = np.full((nRows, topK), -np.inf, dtype=self.scores.dtype)
+        neighbours[:len(self.names)] = self.neighbours
+        scores[:len(self.names)] = self.scores
+
+        # All other cards only have to consider the affected cards as new neighbours
+        keep = np.setdiff1d(np.arange(len(self.names)), recompute)
+        affectedScores = (featureMatrix[affectedIds] @ transposed).toarray().astype(self.scores.dtype)
+        for start in range(0, len(keep), blockSize):
+            rows = keep[start:start+blockSize]
+            candidates = np.hstack([self.neighbours[rows], np.broadcast_to(affectedIds, (len(rows), len(affectedIds)))])
+            candidateScores = np.hstack([self.scores[rows], affectedScores[:, rows].T])
+            order = np.lexsort((candidates, -candidateScores), axis=1)[:, :topK]
+            neighbours[rows] = np.take_along_axis(candidates, order, axis=1)
+            scores[rows] = np.take_along_axis(candidateScores, order, axis=1)
+
+        for start in range(0, len(recompute), blockSize):
+            rows = recompute[start:start+blockSize]
+            block = (featureMatrix[rows] @ transposed).toarray()
+            neighbours[rows], scores[rows] = selectTopK(block, rows, topK)
+
+        self.names = list(names)
+        self.neighbours = neighbours
+        self.scores = scores
+
+
+class QueryIndex:
+    """
+    Similarity index that does not precompute any similarity.
+    It keeps the L2-normalized sparse count matrix in memory and computes
+    the cosine similarity of the queried card to all other cards on demand,
+    which is a single sparse matrix-vector product.
+    """
+
+    def __init__(self, names, featureMatrix):
+        """
+        :param names: List of card names. The position in the list is the row id
+        :param featureMatrix: L2-normalized sparse matrix (CSR) with one row per card
+        """
+        self.names = list(names)
+        self.featureMatrix = featureMatrix
+
+
+    @classmethod
+    def fromCountMatrix(cls, names, countMatrix):
+        return cls(names, normalizeRows(countMatrix, dtype=np.float32))
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def rowScores(self, rowId):
+        """ Cosine similarity of a card to all cards, including itself """
+        return (self.featureMatrix @ self.featureMatrix[rowId].T).toarray().ravel()
+
+
+    def batchScores(self, rowIds):
+        """ Cosine similarity of several cards to all cards as one sparse matrix product
+
+        :param rowIds: Row ids of the queried cards
+        """
+        return (self.featureMatrix[rowIds] @ self.featureMatrix.T).toarray()
+
+
+    def centroidScores(self, rowIds, weights):
+        """ Cosine similarity of all cards to the weighted centroid of several cards.
+        The centroid is built from the feature vectors, so this is one sparse matrix-vector product.
+
+        :param rowIds: Row ids of the cards
+        :param weights: Weight of each card
+        """
+        centroid = np.asarray(weights, dtype=np.float32) @ self.featureMatrix[rowIds]
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid /= norm
+        return self.featureMatrix @ centroid
+
+
+    def update(self, names, featureMatrix, affectedIds, blockSize=1000):
+        """ Replace the feature matrix after cards were added or changed
+
+        :param names: List of all card names after the update
+        :param featureMatrix: L2-normalized sparse matrix of all cards after the update
+        :param affectedIds: Row ids of the added and changed cards
+        :param blockSize: Not used, nothing is precomputed
+        """
+        self.names = list(names)
+        self.featureMatrix = featureMatrix.astype(np.float32).tocsr()
+
+
+    def query(self, rowId, topN=None):
+        """ Return the most similar cards
+
+        :param rowId: Row id of the queried card
+        :param topN: Number of returned cards. If None, all other cards are returned
+
+        Returns (np.ndarray), (np.ndarray): row ids and scores sorted by decreasing score
+        """
+        return rankScores(self.rowScores(rowId), rowId, topN)
+
+
+class EmbeddingIndex:
+    """
+    Similarity index of dense, dimensionality-reduced card vectors.
+    The sparse features are projected to nComponents dimensions with a truncated SVD and only
+    the L2-normalized float32 vectors (N x nComponents) are kept. The similarity of a card to
+    all cards is one dense matrix-vector product, which approximates the cosine similarity
+    of the full features.
+    """
+
+    def __init__(self, names, vectors, components):
+        """
+        :param names: List of card names. The position in the list is the row id
+        :param vectors: Array (N, nComponents) with the L2-normalized vectors of the cards
+        :param components: Array (nComponents, nFeatures) that projects feature rows, e.g. of new cards
+        """
+        self.names = list(names)
+        self.vectors = vectors
+        self.components = components
+
+
+    @classmethod
+    def fromCountMatrix(cls, names, countMatrix, nComponents=128):
+        vectors, components = reduceDimensions(normalizeRows(countMatrix, dtype=np.float32), nComponents)
+        return cls(names, vectors, components)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    @property
+    def nComponents(self):
+        return self.vectors.shape[1]
+
+
+    def rowScores(self, rowId):
+        """ Similarity of a card to all cards, including itself """
+        return self.vectors @ self.vectors[rowId]
+
+
+    def batchScores(self, rowIds):
+        """ Similarity of several cards to all cards as one dense matrix product
+
+        :param rowIds: Row ids of the queried cards
+        """
+        return self.vectors[np.asarray(rowIds)] @ self.vectors.T
+
+
+    def centroidScores(self, rowIds, weights):
+        """ Similarity of all cards to the weighted centroid of the vectors of several cards
+
+        :param rowIds: Row ids of the cards
+        :param weights: Weight of each card
+        """
+        centroid = np.asarray(weights, dtype=np.float32) @ self.vectors[rowIds]
+        norm = np.linalg.norm(centroid)
+        if norm > 0:
+            centroid /= norm
+        return self.vectors @ centroid
+
+
+    def update(self, names, featureMatrix, affectedIds, blockSize=1000):
+        """ Project the added and changed cards with the existing components.
+        Tokens that are new to the vocabulary do not change the projection.
+
+        :param names: List of all card names after the update
+        :param featureMatrix: L2-normalized sparse matrix of all cards after the update
+        :param affectedIds: Row ids of the added and changed cards
+        :param blockSize: Number of rows that are projected at once
+        """
+        affectedIds = np.asarray(affectedIds, dtype=np.intp)
+        vectors = np.zeros((len(names), self.nComponents), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+
+        nFeatures = self.components.shape[1]
+        for start in range(0, len(affectedIds), blockSize):
+            rows = affectedIds[start:start+blockSize]
+            vectors[rows] = normalizeVectors(featureMatrix[rows][:, :nFeatures] @ self.components.T)
+
+        self.names = list(names)
+        self.vectors = vectors
+
+
+    def query(self, rowId, topN=None):
+        """ Return the most similar cards
+
+        :param rowId: Row id of the queried card
+        :param topN: Number of returned cards. If None, all other cards are returned
+
+        Returns (np.ndarray), (np.ndarray): row ids and scores sorted by decreasing score
+        """
+        return rankScores(self.rowScores(rowId), rowId, topN)
+
+
+class MemmapIndex:
+    """
+    Full similarity matrix that is stored on disk and memory-mapped when loaded.
+    Opening it is near-instant and processes that load the same file share the page cache.
+
+    The store consists of two files:
+    - a json file with the card names (the position is the row id), the data type and the shape
+    - a raw array file (the json file name with ".dat" suffix) holding the N x N similarity matrix
+    """
+
+    formatName = 'omenmachine-memmap'
+
+    def __init__(self, names, scores, indexFile=None):
+        """
+        :param names: List of card names. The position in the list is the row id
+        :param scores: Array (N, N) with the similarity scores, usually a np.memmap
+        :param indexFile: Path of the name index file the store was loaded from
+        """
+        self.names = list(names)
+        self.scores = scores
+        self.indexFile = indexFile
+
+
+    @staticmethod
+    def arrayFile(indexFile):
+        return indexFile+'.dat'
+
+
+    @classmethod
+    def isIndexFile(cls, indexFile):
+        """ Check if a file is the name index of a memory-mapped store """
+        with open(indexFile, 'rb') as openFile:
+            return openFile.read(1) == b'{'
+
+
+    @classmethod
+    def create(cls, indexFile, names, countMatrix, dtype='float32', blockSize=1000, nJobs=1):
+        """ Compute the similarity matrix blockwise and write it straight to disk
+
+        :param indexFile: Path of the name index file
+        :param names: List of card names
+        :param countMatrix: Sparse count matrix with one row per card
+        :param dtype: Data type of the stored scores, e.g. "float32", "float16" or "uint8"
+        :param blockSize: Number of rows whose similarity is computed at once
+        :param nJobs: Number of threads that compute the blocks. None uses all cores
+        """
+        def reduceBlock(block, rowIds):
+            return quantizeScores(block, dtype)
+
+        nRows = countMatrix.shape[0]
+        scores = np.memmap(cls.arrayFile(indexFile), dtype=dtype, mode='w+', shape=(nRows, nRows))
+        for start, stop, block in blockCosineSimilarity(countMatrix, blockSize, nJobs, reduceBlock):
+            scores[start:stop] = block
+        scores.flush()
+        del scores
+
+        cls._writeIndexFile(indexFile, names, dtype)
+        return cls.load(indexFile)
+
+
+    @classmethod
+    def _writeIndexFile(cls, indexFile, names, dtype):
+        with open(indexFile, 'w') as outfile:
+            json.dump({
+                'format': cls.formatName,
+                'dtype': np.dtype(dtype).name,
+                'shape': [len(names), len(names)],
+                'array': os.path.basename(cls.arrayFile(indexFile)),
+                'names': list(names),
+                }, outfile)
+
+
+    @classmethod
+    def load(cls, indexFile):
+        """ Open a store that was written with MemmapIndex.create """
+        with open(indexFile) as openFile:
+            header = json.load(openFile)
+
+        if header.get('format') != cls.formatName:
+            raise ValueError('{0} is not a memory-mapped similarity store.'.format(indexFile))
+
+        arrayFile = os.path.join(os.path.dirname(indexFile), header['array'])
+        scores = np.memmap(arrayFile, dtype=header['dtype'], mode='r', shape=tuple(header['shape']))
+        return cls(header['names'], scores, indexFile)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+    def rowScores(self, rowId):
+        """ Similarity of a card to all cards, including itself """
+        if self.scores.dtype == np.uint8:
+            return dequantizeScores(self.scores[rowId])
+        return self.scores[rowId]
+
+
+    def batchScores(self, rowIds):
+        """ Similarity of several cards to all cards
+
+        :param rowIds: Row ids of the queried cards
+        """
+        return np.array(dequantizeScores(self.scores[np.asarray(rowIds)]))
+
+
+    def centroidScores(self, rowIds, weights):
+        """ Cosine similarity of all cards to the weighted centroid of several cards
+
+        :param rowIds: Row ids of the cards
+        :param weights: Weight of each card
+        """
+        return centroidScores(self.batchScores(rowIds), rowIds, weights)
+
+
+    def update(self, names, featureMatrix, affectedIds, blockSize=1000):
+        """ Update the rows and columns of added and changed cards on disk.
+        The existing scores are copied blockwise into a larger array file if cards were added.
+
+        :param names: List of all card names after the update
+        :param featureMatrix: L2-normalized sparse matrix of all cards after the update
+        :param affectedIds: Row ids of the added and changed cards
+        :param blockSize: Number of rows that are copied or computed at once
+        """
+        nOld, nRows = len(self.names), len(names)
+        arrayFile = self.arrayFile(self.indexFile)
+        affectedIds = np.asarray(affectedIds, dtype=np.intp)
+
+        if nRows != nOld:
+            newFile = arrayFile+'.tmp'
+            scores = np.memmap(newFile, dtype=self.scores.dtype, mode='w+', shape=(nRows, nRows))
+            for start in range(0, nOld, blockSize):
+                stop = min(start+blockSize, nOld)
+                scores[start:stop, :nOld] = self.scores[start:stop]
+        else:
+            newFile = arrayFile
+            scores = np.memmap(arrayFile, dtype=self.scores.dtype, mode='r+', shape=(nRows, nRows))
+
+        transposed = featureMatrix.T.tocsc()
+        for start in range(0, len(affectedIds), blockSize):
+            rows = affectedIds[start:start+blockSize]
+            block = quantizeScores((featureMatrix[rows] @ transposed).toarray(), scores.dtype)
+            scores[rows] = block
+            scores[:, rows] = block.T
+        scores.flush()
+        del scores
+
+        dtype = self.scores.dtype
+        self.scores = None
+        if newFile != arrayFile:
+            os.replace(newFile, arrayFile)
+        self._writeIndexFile(self.indexFile, names, dtype)
+
+        updated = self.load(self.indexFile)
+        self.names = updated.names
+        self.scores = updated.scores
+
+
+    def query(self, rowId, topN=None):
+        """ Return the most similar cards
+
+        :param rowId: Row id of the queried card
+        :param topN: Number of returned cards. If None, all other cards are returned
+
+        Returns (np.ndarray), (np.ndarray): row ids and scores sorted by decreasing score
+        """
+        return rankScores(self.rowScores(rowId), rowId, topN)
@@ -0,0 +1,39 @@
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import writeBulkFile
+from omenmachine import OmenMachine, prepJsonFile
+
+
+@pytest.fixture(scope='module')
+def annMachine(tmp_path_factory):
+    """ OmenMachine in "ann" mode whose queries only visit one small cluster """
+    path = tmp_path_factory.mktemp('ann')
+    writeBulkFile(str(path/'bulk.json'), nCards=2000, seed=1)
+    prepJsonFile(str(path/'bulk.json'), str(path/'unique.json'), chatty=False)
+    om = OmenMachine(str(path/'unique.json'), str(path/'similarity'), chatty=False)
+    om.runML(mode='ann', nComponents=32, nLists=100, nProbe=1)
+    om.loadML()
+    return om
+
+
+def testSimilarCardsOnlyReturnCandidates(annMachine):
+    magicCard = annMachine.uniqueNames[0]
+    resultDf = annMachine.getSimilarCards(magicCard, rarityFilter=['mythic'], queryNumber=50)
+
+    # The queried card is the first row
+    similarDf = resultDf.iloc[1:]
+    assert len(similarDf) < 50
+    assert np.isfinite(similarDf['sim_value'].values).all()
+    assert magicCard not in set(similarDf['name'])
+
+
+def testDeckRecommendationsOnlyReturnCandidates(annMachine):
+    decklist = {magicCard: 1 for magicCard in annMachine.uniqueNames[:3]}
+    resultDf = annMachine.getDeckRecommendations(decklist, rarityFilter=['mythic'], queryNumber=50)
+
+    assert len(resultDf) < 50
+    assert np.isfinite(resultDf['sim_value'].values).all()
+    assert not set(decklist) & set(resultDf['name'])
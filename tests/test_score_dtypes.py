@@ -0,0 +1,30 @@
+# coding: utf-8
+
+import pytest
+
+from benchmarks.synthetic import writeBulkFile
+from omenmachine import OmenMachine, prepJsonFile
+
+
+@pytest.fixture(scope='module')
+def uniqueFile(tmp_path_factory):
+    path = tmp_path_factory.mktemp('dtypes')
+    writeBulkFile(str(path/'bulk.json'), nCards=300, seed=2)
+    prepJsonFile(str(path/'bulk.json'), str(path/'unique.json'), chatty=False)
+    return str(path/'unique.json')
+
+
+@pytest.mark.parametrize('mode, scoreDtype', [('dense', 'uint8'), ('topk', 'uint8'), ('topk', 'float64'), ('memmap', 'int32')])
+def testRejectedScoreDtype(uniqueFile, tmp_path, mode, scoreDtype):
+    om = OmenMachine(uniqueFile, str(tmp_path/'similarity'), chatty=False)
+    with pytest.raises(ValueError, match='not supported in {0} mode'.format(mode)):
+        om.runML(mode=mode, scoreDtype=scoreDtype)
+
+
+@pytest.mark.parametrize('mode', sorted(OmenMachine.scoreDtypes))
+def testSupportedScoreDtypes(uniqueFile, tmp_path, mode):
+    for scoreDtype in OmenMachine.scoreDtypes[mode]:
+        om = OmenMachine(uniqueFile, str(tmp_path/scoreDtype), chatty=False)
+        om.runML(mode=mode, scoreDtype=scoreDtype)
+        om.loadML()
+        assert len(om.getSimilarCards(om.uniqueNames[0])) == 11
@@ -0,0 +1,62 @@
+# coding: utf-8
+
+import json
+import asyncio
+
+import pytest
+
+from benchmarks.synthetic import writeBulkFile
+from omenmachine import OmenMachine, prepJsonFile
+from omenmachine.serve import RecommendationService, InProcessClient
+
+
+@pytest.fixture(scope='module')
+def om(tmp_path_factory):
+    path = tmp_path_factory.mktemp('serve')
+    writeBulkFile(str(path/'bulk.json'), nCards=300, seed=3)
+    prepJsonFile(str(path/'bulk.json'), str(path/'unique.json'), chatty=False)
+    om = OmenMachine(str(path/'unique.json'), str(path/'similarity'), chatty=False)
+    om.runML(mode='topk')
+    om.loadML()
+    return om
+
+
+@pytest.mark.parametrize('parameters, message', [
+    ({'cmcFilter': '~3'}, 'Invalid cmcFilter'),
+    ({'legalityFilter': 'nonexistent'}, 'Unknown format'),
+    ({'typeFilter': [1, 2]}, 'typeFilter has to be'),
+    ])
+def testInvalidFilters(om, parameters, message):
+    status, payload = InProcessClient(RecommendationService(om)).post('/batch', dict(cards=om.uniqueNames[:2], **parameters))
+    assert status == 400
+    assert message in payload['error']
+
+
+def testInternalError(om, monkeypatch):
+    def failingQuery(*args, **kwargs):
+        raise KeyError('bug')
+    monkeypatch.setattr(om, 'getSimilarCards', failingQuery)
+
+    status, payload = InProcessClient(RecommendationService(om)).get('/similar', card=om.uniqueNames[0])
+    assert status == 500
+    assert payload == {'error': 'Internal server error.'}
+
+
+def testConnection(om):
+    service = RecommendationService(om)
+
+    async def requests():
+        server = await asyncio.start_server(service.handleConnection, '127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            body = json.dumps({'cards': om.uniqueNames[:2], 'queryNumber': 3}).encode()
+            # Two requests on the same connection
+            writer.write(b'GET /health HTTP/1.1\r\n\r\n')
+            writer.write(b'POST /batch HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % len(body) + body)
+            response = await reader.read()
+            writer.close()
+        return response
+
+    response = asyncio.run(requests())
+    assert response.count(b'HTTP/1.1 200 OK') == 2
+    assert json.loads(response.rsplit(b'\r\n\r\n', 1)[1])['unknown'] == []